@@ -0,0 +1,137 @@
+import time
+import random
+import asyncio
+import logging
+import argparse
+import numpy as np
+from asyncio import Event
+from aiortc import RTCPeerConnection, MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from src.SincromisorClient.MonoOpusEncoder import MonoOpusEncoder
+from src.SincromisorClient.AdaptiveBitrateController import AdaptiveBitrateController
+from src.SincromisorClient.SquareWave import SquareWave
+
+# サーバーやサウンドデバイスを使わずに、ローカルの2つのRTCPeerConnection間で
+# 送信側のパケットを間引いたり遅らせたりして、AdaptiveBitrateControllerの動きを確認する。
+
+
+class SquareWaveOpusTrack(MediaStreamTrack):
+    # OpusSenderTrackと同じくエンコード済みのPacketを返すが、音源は矩形波。
+    kind = "audio"
+
+    def __init__(self):
+        super().__init__()
+        self.encoder: MonoOpusEncoder = MonoOpusEncoder()
+        self.wave_generator: SquareWave = SquareWave(samplerate=self.encoder.samplerate)
+        self.timestamp: int = 0
+        self.started_at: float | None = None
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        if self.started_at is None:
+            self.started_at = time.time()
+        else:
+            wait = self.started_at + self.timestamp / self.encoder.samplerate - time.time()
+            await asyncio.sleep(wait)
+        samples: np.ndarray = self.wave_generator.generate(self.encoder.frame_samples)
+        self.timestamp += len(samples)
+        packets = self.encoder.encode(
+            samples.astype(np.int16).reshape(-1), self.timestamp
+        )
+        return packets[0]
+
+
+class LossyLink:
+    # RTCDtlsTransportの送信を横取りし、指定の確率で捨て、指定の遅延とゆらぎを加える。
+    def __init__(self, transport, seed: int = 0):
+        self.send_rtp = transport._send_rtp
+        self.loss: float = 0.0
+        self.delay: float = 0.0
+        self.jitter: float = 0.0
+        self.random = random.Random(seed)
+        self.tasks: set[asyncio.Task] = set()
+        transport._send_rtp = self.__send_rtp
+
+    async def __send_rtp(self, data: bytes) -> None:
+        if self.random.random() < self.loss:
+            return
+        delay = max(0.0, self.delay + self.random.uniform(-self.jitter, self.jitter))
+        task = asyncio.create_task(self.__delayed_send(data, delay))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def __delayed_send(self, data: bytes, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self.send_rtp(data)
+        except ConnectionError:
+            pass
+
+
+async def consume(track: MediaStreamTrack, shutdown_event: Event) -> None:
+    try:
+        while not shutdown_event.is_set():
+            await track.recv()
+    except MediaStreamError:
+        pass
+
+
+async def simulate(args) -> None:
+    shutdown_event: Event = Event()
+    sender_pc = RTCPeerConnection()
+    receiver_pc = RTCPeerConnection()
+    track = SquareWaveOpusTrack()
+    sender_pc.addTrack(track)
+
+    @receiver_pc.on("track")
+    def on_track(remote_track: MediaStreamTrack):
+        asyncio.create_task(consume(remote_track, shutdown_event))
+
+    await sender_pc.setLocalDescription(await sender_pc.createOffer())
+    await receiver_pc.setRemoteDescription(sender_pc.localDescription)
+    await receiver_pc.setLocalDescription(await receiver_pc.createAnswer())
+    await sender_pc.setRemoteDescription(receiver_pc.localDescription)
+    while sender_pc.connectionState != "connected":
+        await asyncio.sleep(0.1)
+
+    link = LossyLink(sender_pc.getSenders()[0].transport, seed=args.seed)
+    controller = AdaptiveBitrateController(
+        encoder=track.encoder, interval=args.interval, log_path=args.log
+    )
+    controller_task = asyncio.create_task(controller.run(sender_pc, shutdown_event))
+
+    # (名前, ロス率, 遅延秒, 遅延のゆらぎ秒)
+    phases = [
+        ("clean", 0.0, 0.01, 0.0),
+        ("congested", args.loss, args.delay, args.jitter),
+        ("recovered", 0.0, 0.01, 0.0),
+    ]
+    for name, loss, delay, jitter in phases:
+        link.loss, link.delay, link.jitter = loss, delay, jitter
+        print(f"phase {name}: loss={loss} delay={delay} jitter={jitter}")
+        await asyncio.sleep(args.phase_seconds)
+        print(f"  -> level {controller.level}: {controller.encoder.settings()}")
+
+    shutdown_event.set()
+    controller_task.cancel()
+    track.stop()
+    await sender_pc.close()
+    await receiver_pc.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AdaptiveBitrateController simulation")
+    parser.add_argument("--phase-seconds", type=float, default=20.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--loss", type=float, default=0.15)
+    parser.add_argument("--delay", type=float, default=0.15)
+    parser.add_argument("--jitter", type=float, default=0.03)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--log", type=str, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    logging.getLogger("aiortc").setLevel(logging.WARNING)
+    logging.getLogger("aioice.ice").setLevel(logging.WARNING)
+    asyncio.run(simulate(args))
@@ -0,0 +1,49 @@
+import time
+import argparse
+import numpy as np
+from src.SincromisorClient.AudioMixer import AudioMixer
+
+# AudioMixer.mixの1回(= PortAudioのコールバック1回分、20ms)あたりの処理時間を、
+# ミックスするソースの数を増やしながら測る。
+
+BLOCKSIZE = 960
+CHANNELS = 2
+
+
+def bench(source_count: int, iterations: int) -> list[float]:
+    rng = np.random.default_rng(0)
+    mixer = AudioMixer(blocksize=BLOCKSIZE, channels=CHANNELS, max_sources=source_count)
+    sources = [mixer.add_source(f"source{idx}", gain=0.8) for idx in range(source_count)]
+    frames = rng.integers(
+        -20000, 20000, size=(16, BLOCKSIZE * CHANNELS), dtype=np.int16
+    )
+    timings: list[float] = []
+    for idx in range(iterations):
+        # 受信側と同じく、毎回各ソースに1フレームずつ届く。
+        for source in sources:
+            source.push(frames[idx % len(frames)])
+        start = time.perf_counter()
+        mixer.mix()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AudioMixer benchmark")
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument(
+        "--sources", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32]
+    )
+    args = parser.parse_args()
+
+    budget: float = BLOCKSIZE / 48000
+    print(f"callback budget: {budget * 1000:.1f} ms")
+    for source_count in args.sources:
+        timings = np.array(bench(source_count, args.iterations))
+        print(
+            f"sources={source_count:3d}:"
+            f" mean {timings.mean() * 1e6:8.1f} us"
+            f" p99 {np.percentile(timings, 99) * 1e6:8.1f} us"
+            f" max {timings.max() * 1e6:8.1f} us"
+            f" ({timings.mean() / budget * 100:.2f} % of budget)"
+        )
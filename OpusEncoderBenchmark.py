@@ -0,0 +1,99 @@
+import time
+import argparse
+import numpy as np
+from fractions import Fraction
+from av.audio.frame import AudioFrame
+from aiortc.codecs.opus import OpusEncoder
+from src.SincromisorClient.MonoOpusEncoder import MonoOpusEncoder
+
+# 1セッション分の送信音声のエンコードにかかるCPU時間を、
+# aiortc標準の経路(48000Hz/2chへリサンプルしてエンコード)と
+# MonoOpusEncoder(モノラルのまま直接エンコード)とで比較する。
+# aiortcと同じ設定のモノラルも測り、経路の違い(リサンプルと2chエンコードの省略)による差と、
+# ビットレートやcomplexityなど設定の違いによる差を分けて見られるようにする。
+
+# aiortcのOpusEncoderの設定(96kbps、complexityはlibopus既定の10、FECなし)
+AIORTC_SETTINGS: dict = {"bitrate": 96000, "complexity": 10, "fec": False, "dtx": False, "packet_loss": 0}
+
+SAMPLERATE = 48000
+BLOCKSIZE = 960
+
+
+def generate_blocks(seconds: int) -> list[np.ndarray]:
+    # 無音区間を挟んだ、音声っぽい振幅変化のあるノイズ混じりの信号。
+    rng = np.random.default_rng(0)
+    t = np.arange(seconds * SAMPLERATE) / SAMPLERATE
+    envelope = (np.sin(2 * np.pi * 0.5 * t) > 0) * np.abs(np.sin(2 * np.pi * 3 * t))
+    signal = np.sin(2 * np.pi * 220 * t) + 0.3 * rng.standard_normal(len(t))
+    samples = (signal * envelope * 8000).astype(np.int16)
+    return list(samples.reshape(-1, BLOCKSIZE))
+
+
+def bench_aiortc(blocks: list[np.ndarray]) -> tuple[float, int]:
+    encoder = OpusEncoder()
+    sent_bytes = 0
+    start = time.process_time()
+    for idx, block in enumerate(blocks):
+        frame = AudioFrame.from_ndarray(
+            block.reshape(1, BLOCKSIZE), format="s16", layout="mono"
+        )
+        frame.pts = (idx + 1) * BLOCKSIZE
+        frame.time_base = Fraction(1, SAMPLERATE)
+        frame.sample_rate = SAMPLERATE
+        payloads, _ = encoder.encode(frame)
+        sent_bytes += sum(len(p) for p in payloads)
+    return time.process_time() - start, sent_bytes
+
+
+def bench_mono(
+    blocks: list[np.ndarray],
+    bitrate: int,
+    complexity: int,
+    fec: bool,
+    dtx: bool,
+    packet_loss: int = 10,
+) -> tuple[float, int]:
+    encoder = MonoOpusEncoder(
+        bitrate=bitrate, complexity=complexity, fec=fec, dtx=dtx, packet_loss=packet_loss
+    )
+    sent_bytes = 0
+    start = time.process_time()
+    for idx, block in enumerate(blocks):
+        packets = encoder.encode(block, (idx + 1) * BLOCKSIZE)
+        sent_bytes += sum(p.size for p in packets)
+    return time.process_time() - start, sent_bytes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Opus uplink encoding benchmark")
+    parser.add_argument("--seconds", type=int, default=60)
+    parser.add_argument("--bitrate", type=int, default=24000)
+    parser.add_argument("--complexity", type=int, default=3)
+    parser.add_argument("--fec", action=argparse.BooleanOptionalAction, default=True)
+    parser.add_argument("--dtx", action=argparse.BooleanOptionalAction, default=False)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    blocks = generate_blocks(args.seconds)
+    # CPU時間のばらつきを抑えるため、何回か測って最小値を使う。
+    results = {
+        "aiortc (48kHz/2ch)": min(bench_aiortc(blocks) for _ in range(args.repeat)),
+        "mono (aiortc settings)": min(
+            bench_mono(blocks, **AIORTC_SETTINGS) for _ in range(args.repeat)
+        ),
+        f"mono (bitrate={args.bitrate}, complexity={args.complexity})": min(
+            bench_mono(
+                blocks,
+                bitrate=args.bitrate,
+                complexity=args.complexity,
+                fec=args.fec,
+                dtx=args.dtx,
+            )
+            for _ in range(args.repeat)
+        ),
+    }
+    print(f"audio: {args.seconds} s / session")
+    for name, (cpu_time, sent_bytes) in results.items():
+        print(f"{name}:")
+        print(f"  CPU time: {cpu_time:.3f} s ({cpu_time / args.seconds * 100:.2f} % of 1 core)")
+        print(f"  bitrate: {sent_bytes * 8 / args.seconds / 1000:.1f} kbps")
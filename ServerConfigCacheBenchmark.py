@@ -0,0 +1,110 @@
+import os
+import json
+import time
+import argparse
+import hashlib
+import tempfile
+import threading
+import statistics
+import requests
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.SincromisorClient.SincromisorConfig import SignalingEndpointConfig
+from src.SincromisorClient.ServerConfigCache import ServerConfigCache
+
+# 起動時にconfig.jsonからoffer/candidate/ICE設定を得るまでの時間を、
+# キャッシュ無し(毎回取得)・コールド(キャッシュファイル無し)・ウォーム(キャッシュ有り)で比較する。
+# サーバーはローカルに立て、--delayで応答の遅さを模擬する。
+
+SERVER_CONFIG: dict = {
+    "offerURL": "/api/v1/RTCSignalingServer/offer",
+    "candidateURL": "/api/v1/RTCSignalingServer/candidate",
+    "iceServers": [{"urls": ["stun:stun.example.com:3478"]}],
+}
+
+
+def start_server(delay: float) -> str:
+    body: bytes = json.dumps(SERVER_CONFIG).encode()
+    etag: str = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+    class ConfigHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(delay)
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ConfigHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/api/v1/RTCSignalingServer/config.json"
+
+
+def startup_without_cache(endpoint: SignalingEndpointConfig) -> None:
+    # 以前の_merge_signaling_configと同じく、毎回ブロッキングで取得する。
+    response = requests.get(str(endpoint.config_url), timeout=10)
+    response.raise_for_status()
+    data: dict = endpoint.model_dump(mode="json", exclude_none=True)
+    SignalingEndpointConfig(
+        **SignalingEndpointConfig._apply_server_config(data, response.json())
+    )
+
+
+def startup_with_cache(endpoint: SignalingEndpointConfig, cache_path: str, ttl: float) -> None:
+    endpoint.resolve(ServerConfigCache(cache_path=cache_path, ttl=ttl))
+
+
+def measure(fn, repeat: int, setup=None) -> list[float]:
+    timings: list[float] = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start: float = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="config.json startup benchmark")
+    parser.add_argument("--delay", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    endpoint = SignalingEndpointConfig(config_url=start_server(args.delay))
+    cache_path: str = os.path.join(tempfile.mkdtemp(), "server_config_cache.json")
+
+    def remove_cache() -> None:
+        if os.path.exists(cache_path):
+            os.remove(cache_path)
+
+    results: dict = {
+        "no cache": measure(lambda: startup_without_cache(endpoint), args.repeat),
+        "cold": measure(
+            lambda: startup_with_cache(endpoint, cache_path, ttl=60.0),
+            args.repeat,
+            setup=remove_cache,
+        ),
+        "warm (fresh)": measure(
+            lambda: startup_with_cache(endpoint, cache_path, ttl=60.0), args.repeat
+        ),
+        # ttl=0なので毎回バックグラウンドで再検証(304)が走るが、起動は待たない。
+        "warm (revalidating)": measure(
+            lambda: startup_with_cache(endpoint, cache_path, ttl=0.0), args.repeat
+        ),
+    }
+    print(f"server delay: {args.delay * 1000:.0f} ms")
+    for name, timings in results.items():
+        print(
+            f"{name}: median {statistics.median(timings) * 1000:.2f} ms"
+            f" / max {max(timings) * 1000:.2f} ms"
+        )
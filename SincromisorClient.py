@@ -1,16 +1,75 @@
+import time
 import logging
 import asyncio
 import json
+import requests
 from asyncio import AbstractEventLoop, Event
-from aiortc import AudioStreamTrack, RTCDataChannel
+from aiortc import RTCDataChannel
 from src.SincromisorClient import (
     AudioSenderTrack,
+    AudioCaptureHub,
+    OpusSenderTrack,
+    AdaptiveBitrateController,
     AudioPlayer,
     SincromisorRTCClient,
     SincromisorClientConfig,
+    SignalingEndpointConfig,
+    EndpointSelector,
+    ServerConfigCache,
 )
 from multiprocessing import freeze_support
 
+# セッションが切れた時やどのサーバーにも接続できなかった時に、接続し直すまでの待ち時間(秒)。
+# 続けて失敗するたびに倍にし、RECONNECT_MAX_INTERVALで頭打ちにする。
+RECONNECT_INTERVAL: float = 3.0
+RECONNECT_MAX_INTERVAL: float = 60.0
+
+def create_sender_track(
+    config: SincromisorClientConfig, capture_hub: AudioCaptureHub, shutdown_event: Event
+) -> AudioSenderTrack:
+    # aiortcはセッションを閉じる時に送信トラックをstop(ended)するので、
+    # セッションごとにcapture_hubから新しいトラックを作り、セッションと一緒に閉じる。
+    if config.sender_encoder.native_mono:
+        return OpusSenderTrack(
+            channels=config.sender_device.channels,
+            samplerate=config.sender_device.samplerate,
+            dtype=config.sender_device.dtype,
+            blocksize=config.sender_device.blocksize,
+            device=config.sender_device.device,
+            latency=config.sender_device.latency,
+            shutdown_event=shutdown_event,
+            capture_hub=capture_hub,
+            bitrate=config.sender_encoder.bitrate,
+            complexity=config.sender_encoder.complexity,
+            fec=config.sender_encoder.fec,
+            dtx=config.sender_encoder.dtx,
+            packet_loss=config.sender_encoder.packet_loss,
+            frame_duration=config.sender_encoder.frame_duration,
+        )
+    return AudioSenderTrack(
+        channels=config.sender_device.channels,
+        samplerate=config.sender_device.samplerate,
+        dtype=config.sender_device.dtype,
+        blocksize=config.sender_device.blocksize,
+        device=config.sender_device.device,
+        latency=config.sender_device.latency,
+        shutdown_event=shutdown_event,
+        capture_hub=capture_hub,
+    )
+
+
+def create_bitrate_controller(
+    config: SincromisorClientConfig, audio_sender_track: AudioSenderTrack
+) -> AdaptiveBitrateController | None:
+    if not config.sender_encoder.adaptive:
+        return None
+    return AdaptiveBitrateController(
+        encoder=audio_sender_track.encoder,
+        interval=config.sender_encoder.adaptive_interval,
+        log_path=config.sender_encoder.adaptive_log,
+    )
+
+
 class CustomizedSincromisorClient(SincromisorRTCClient):
     async def text_ch_on_message(self, channel: RTCDataChannel, message: str) -> None:
         print([channel.label, json.loads(message)])
@@ -32,13 +91,14 @@ if __name__ == "__main__":
     print(config)
     shutdown_event: Event = Event()
 
-    audio_sender_track: AudioStreamTrack = AudioSenderTrack(
+    # マイクは1つの録音プロセスだけで開き、送信トラックはそこから受け取る。
+    capture_hub: AudioCaptureHub = AudioCaptureHub(
         channels=config.sender_device.channels,
         samplerate=config.sender_device.samplerate,
         dtype=config.sender_device.dtype,
         blocksize=config.sender_device.blocksize,
         device=config.sender_device.device,
-        shutdown_event=shutdown_event,
+        latency=config.sender_device.latency,
     )
 
     audio_player: AudioPlayer = AudioPlayer(
@@ -47,31 +107,96 @@ if __name__ == "__main__":
         dtype=config.receiver_device.dtype,
         blocksize=config.receiver_device.blocksize,
         device=config.receiver_device.device,
+        latency=config.receiver_device.latency,
     )
 
-    scli: SincromisorRTCClient = CustomizedSincromisorClient(
-        audio_sender_track=audio_sender_track,
-        audio_player=audio_player,
-        offer_url=str(config.offer_url),
-        candidate_url=config.resolved_candidate_url,
-        ice_server=config.ice_server,
-        ice_servers=config.resolved_ice_servers,
-        talk_mode=config.talk_mode,
-        shutdown_event=shutdown_event,
+    loop: AbstractEventLoop = asyncio.get_event_loop()
+    server_config_cache: ServerConfigCache = config.create_server_config_cache()
+    endpoint_selector: EndpointSelector = EndpointSelector(
+        endpoints=config.signaling_endpoints,
+        server_config_cache=server_config_cache,
+        cache_path=config.endpoint_probe.cache_path,
+        ttl=config.endpoint_probe.ttl,
+        timeout=config.endpoint_probe.timeout,
+        ice_probe=config.endpoint_probe.ice,
     )
 
+    # 応答の速いサーバーから順に接続し、offerの失敗やセッションの切断があれば次へ切り替える。
+    # セッションごとにshutdown_eventを分け、切り替え時にマイクの録音を止めないようにする。
+    # セッションが切れた場合やどのサーバーにも接続できなかった場合は、待ってから選び直して接続し直す。
+    # 再接続時はconfig.jsonを再検証してから補完するので、サーバー側の設定変更に追従できる。
+    scli: SincromisorRTCClient | None = None
+    audio_sender_track: AudioSenderTrack | None = None
+    reconnecting: bool = False
+    reconnect_interval: float = RECONNECT_INTERVAL
     try:
-        loop: AbstractEventLoop = asyncio.get_event_loop()
-        loop.run_until_complete(scli.run())
+        while True:
+            endpoints: list[SignalingEndpointConfig] = loop.run_until_complete(
+                endpoint_selector.select()
+            )
+            connected: bool = False
+            for endpoint in endpoints:
+                logger.info(f"connect to {endpoint.key}")
+                # 起動時はキャッシュ済みのconfig.jsonで待たずに補完し、古ければ裏で再検証する。
+                try:
+                    resolved_endpoint: SignalingEndpointConfig = endpoint.resolve(
+                        server_config_cache, revalidate=reconnecting
+                    )
+                except (requests.RequestException, ValueError) as e:
+                    logger.warning(["ServerConfigError", endpoint.key, e])
+                    endpoint_selector.mark_failed(endpoint)
+                    continue
+                session_shutdown_event: Event = Event()
+                audio_sender_track = create_sender_track(
+                    config, capture_hub, session_shutdown_event
+                )
+                scli = CustomizedSincromisorClient(
+                    audio_sender_track=audio_sender_track,
+                    audio_player=audio_player,
+                    offer_url=str(resolved_endpoint.offer_url),
+                    candidate_url=resolved_endpoint.resolved_candidate_url,
+                    ice_server=resolved_endpoint.ice_server,
+                    ice_servers=resolved_endpoint.resolved_ice_servers,
+                    talk_mode=config.talk_mode,
+                    shutdown_event=session_shutdown_event,
+                    bitrate_controller=create_bitrate_controller(config, audio_sender_track),
+                )
+                try:
+                    loop.run_until_complete(scli.run())
+                except (ConnectionError, requests.RequestException) as e:
+                    logger.warning(["SessionError", endpoint.key, e])
+                connected = scli.connected
+                endpoint_selector.mark_failed(endpoint)
+                loop.run_until_complete(scli.close())
+                scli = None
+                audio_sender_track.close()
+                audio_sender_track = None
+                if connected:
+                    break
+            reconnecting = True
+            if connected:
+                reconnect_interval = RECONNECT_INTERVAL
+                logger.info(f"session lost. reconnect in {reconnect_interval}s.")
+            else:
+                logger.error(
+                    f"no Sincromisor server is available. retry in {reconnect_interval}s."
+                )
+            time.sleep(reconnect_interval)
+            if not connected:
+                reconnect_interval = min(reconnect_interval * 2, RECONNECT_MAX_INTERVAL)
     except KeyboardInterrupt:
         pass
 
     logger.info("send ShutdownEvent")
     shutdown_event.set()
     logger.info("close SincromisorClient")
-    loop.run_until_complete(scli.close())
+    if scli is not None:
+        loop.run_until_complete(scli.close())
     logger.info("close SenderTrack")
-    audio_sender_track.close()
+    if audio_sender_track is not None:
+        audio_sender_track.close()
+    logger.info("close CaptureHub")
+    capture_hub.close()
     logger.info("close AudioPlayer")
     audio_player.close()
     loop.close()
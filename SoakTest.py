@@ -0,0 +1,401 @@
+import sys
+import json
+import time
+import asyncio
+import logging
+import argparse
+import threading
+import numpy as np
+from asyncio import Event
+from fractions import Fraction
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from av.audio.frame import AudioFrame
+from aiortc import RTCPeerConnection, RTCSessionDescription, RTCDataChannel, MediaStreamTrack
+from aiortc.mediastreams import MediaStreamError
+from src.SincromisorClient import (
+    AudioSenderTrack,
+    OpusSenderTrack,
+    AudioPlayer,
+    SincromisorRTCClient,
+    SoakMonitor,
+)
+from src.SincromisorClient.AudioCaptureHub import SharedAudioRing, AudioCaptureSubscription
+from src.SincromisorClient.SquareWave import SquareWave
+
+# サウンドデバイスやSincromisorサーバーを使わずに、ローカルのサーバー役のピアを相手に
+# SincromisorRTCClientを長時間動かし、メモリやイベントループの遅れ、キューの深さの推移を記録する。
+# 音声は--speed倍の速さで流すので、短い時間で長時間分のフレームやメッセージを処理できる。
+
+SAMPLERATE = 48000
+BLOCKSIZE = 960
+
+
+class SyntheticCaptureHub:
+    # AudioCaptureHubの代わりに、矩形波を--speed倍の速さでリングバッファに書き込む。
+    def __init__(self, speed: float, slots: int = 50):
+        self.ring: SharedAudioRing = SharedAudioRing(slots=slots, frame_samples=BLOCKSIZE)
+        self.subscriptions: list[AudioCaptureSubscription] = []
+        self.period: float = BLOCKSIZE / SAMPLERATE / speed
+        self.wave_generator: SquareWave = SquareWave(samplerate=SAMPLERATE)
+        self.running: bool = True
+        self.thread = threading.Thread(target=self.__write, daemon=True)
+        self.thread.start()
+
+    def __write(self) -> None:
+        block: np.ndarray = self.wave_generator.generate(BLOCKSIZE).astype(np.int16)
+        next_at: float = time.perf_counter()
+        while self.running:
+            self.ring.write(block)
+            next_at += self.period
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+
+    def subscribe(self) -> AudioCaptureSubscription:
+        subscription = AudioCaptureSubscription(self.ring, period=self.period)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: AudioCaptureSubscription) -> None:
+        subscription.close()
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+
+    def close(self) -> None:
+        self.running = False
+        self.thread.join()
+        self.ring.close()
+
+
+class PacedOutputStream:
+    # sd.OutputStreamの代わりに、--speed倍の速さでコールバックを呼ぶ。
+    def __init__(self, callback, channels: int, blocksize: int, speed: float):
+        self.callback = callback
+        self.outdata: np.ndarray = np.zeros((blocksize, channels), dtype=np.int16)
+        self.blocksize: int = blocksize
+        self.period: float = blocksize / SAMPLERATE / speed
+        self.running: bool = False
+        self.thread: threading.Thread | None = None
+
+    def __run(self) -> None:
+        next_at: float = time.perf_counter()
+        while self.running:
+            self.callback(self.outdata, self.blocksize, None, None)
+            next_at += self.period
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+
+    def start(self) -> None:
+        self.running = True
+        self.thread = threading.Thread(target=self.__run, daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+
+    def close(self) -> None:
+        pass
+
+
+class PacedAudioPlayer(AudioPlayer):
+    def __init__(self, speed: float):
+        self.speed: float = speed
+        super().__init__()
+
+    def _open_output_stream(self, callback) -> PacedOutputStream:
+        return PacedOutputStream(callback, self.channels, self.blocksize, self.speed)
+
+
+class PacedToneTrack(MediaStreamTrack):
+    # サーバー役が返す合成音声の代わり。--speed倍の速さでフレームを返す。
+    kind = "audio"
+
+    def __init__(self, speed: float):
+        super().__init__()
+        self.period: float = BLOCKSIZE / SAMPLERATE / speed
+        self.wave_generator: SquareWave = SquareWave(samplerate=SAMPLERATE, freq=440)
+        self.timestamp: int = 0
+        self.next_at: float | None = None
+
+    async def recv(self):
+        if self.readyState != "live":
+            raise MediaStreamError
+        if self.next_at is None:
+            self.next_at = time.perf_counter()
+        self.next_at += self.period
+        await asyncio.sleep(max(0.0, self.next_at - time.perf_counter()))
+        samples: np.ndarray = self.wave_generator.generate(BLOCKSIZE).astype(np.int16)
+        frame = AudioFrame.from_ndarray(
+            samples.reshape(1, BLOCKSIZE), format="s16", layout="mono"
+        )
+        self.timestamp += frame.samples
+        frame.pts = self.timestamp
+        frame.time_base = Fraction(1, SAMPLERATE)
+        frame.sample_rate = SAMPLERATE
+        return frame
+
+
+class StandInServer:
+    # Sincromisorサーバーの代わりに、offerに応答して音声を返し、
+    # text_ch/telop_chに一定の間隔でメッセージを送り続けるピア。
+    # クライアントはofferをブロッキングで送るので、別スレッドのイベントループで動かす。
+    def __init__(self, speed: float, messages_per_second: float):
+        self.speed: float = speed
+        self.message_interval: float = 1 / messages_per_second / speed
+        self.peers: list[RTCPeerConnection] = []
+        self.tasks: set[asyncio.Task] = set()
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self.__handler())
+        self.http_thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.http_thread.start()
+
+    @property
+    def offer_url(self) -> str:
+        return f"http://127.0.0.1:{self.httpd.server_port}/offer"
+
+    def __handler(self):
+        server = self
+
+        class SignalingHandler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body: dict = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if self.path == "/offer":
+                    result: dict = asyncio.run_coroutine_threadsafe(
+                        server.answer(body), server.loop
+                    ).result()
+                else:
+                    result = {}
+                payload: bytes = json.dumps(result).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return SignalingHandler
+
+    def __spawn(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def answer(self, offer: dict) -> dict:
+        rpc = RTCPeerConnection()
+        self.peers.append(rpc)
+        rpc.addTrack(PacedToneTrack(self.speed))
+
+        @rpc.on("track")
+        def on_track(track: MediaStreamTrack):
+            self.__spawn(self.__consume(track))
+
+        @rpc.on("datachannel")
+        def on_datachannel(channel: RTCDataChannel):
+            self.__spawn(self.__send_messages(channel))
+
+        await rpc.setRemoteDescription(
+            RTCSessionDescription(sdp=offer["sdp"], type=offer["type"])
+        )
+        await rpc.setLocalDescription(await rpc.createAnswer())
+        return {
+            "sdp": rpc.localDescription.sdp,
+            "type": rpc.localDescription.type,
+            "session_id": f"soak-{len(self.peers)}",
+        }
+
+    async def __consume(self, track: MediaStreamTrack) -> None:
+        try:
+            while True:
+                await track.recv()
+        except MediaStreamError:
+            pass
+
+    async def __send_messages(self, channel: RTCDataChannel) -> None:
+        while channel.readyState != "open":
+            await asyncio.sleep(0.01)
+        sequence_id: int = 0
+        while channel.readyState == "open":
+            sequence_id += 1
+            channel.send(
+                json.dumps(
+                    {"session_id": "soak", "sequence_id": sequence_id, "resultText": "テストです。"}
+                )
+            )
+            await asyncio.sleep(self.message_interval)
+
+    async def __close_peers(self) -> None:
+        for task in list(self.tasks):
+            task.cancel()
+        for rpc in self.peers:
+            await rpc.close()
+
+    def close(self) -> None:
+        asyncio.run_coroutine_threadsafe(self.__close_peers(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join()
+        self.httpd.shutdown()
+
+
+class SoakClient(SincromisorRTCClient):
+    # メッセージはログに出さずに数えるだけにする。
+    messages: int = 0
+
+    async def text_ch_on_message(self, channel: RTCDataChannel, message: str) -> None:
+        json.loads(message)
+        self.messages += 1
+
+    async def telop_ch_on_message(self, channel: RTCDataChannel, message: str) -> None:
+        json.loads(message)
+        self.messages += 1
+
+
+async def watch_session(
+    args, monitor: SoakMonitor, client_task: asyncio.Task, monitor_event: Event
+) -> None:
+    # セッションが途中で切れると、残りの時間は何もしていないプロセスを測ることになるので、
+    # 切れたことが分かった時点で失敗として打ち切る。
+    started_at: float = time.perf_counter()
+    last_messages: int = 0
+    last_progress_at: float = started_at
+    while True:
+        await asyncio.sleep(args.interval)
+        now: float = time.perf_counter()
+        elapsed: float = now - started_at
+        if elapsed >= args.duration:
+            break
+        if client_task.done():
+            if client_task.cancelled():
+                cause = "cancelled"
+            else:
+                cause = repr(client_task.exception()) if client_task.exception() else "closed"
+            monitor.fail(f"session ended at {elapsed:.1f}s ({cause})")
+            break
+        if not monitor.samples or elapsed < args.startup_grace:
+            continue
+        sample: dict = monitor.samples[-1]
+        if sample["mixer_sources"] == 0:
+            monitor.fail(f"receiving track ended at {elapsed:.1f}s")
+            break
+        if sample["messages"] > last_messages:
+            last_messages = sample["messages"]
+            last_progress_at = now
+        elif now - last_progress_at >= args.stall_timeout:
+            monitor.fail(
+                f"messages stopped at {last_messages} for {now - last_progress_at:.1f}s"
+                f" (at {elapsed:.1f}s)"
+            )
+            break
+    monitor_event.set()
+
+
+async def soak(args) -> int:
+    server = StandInServer(speed=args.speed, messages_per_second=args.messages_per_second)
+    capture_hub = SyntheticCaptureHub(speed=args.speed)
+    shutdown_event: Event = Event()
+    track_class = OpusSenderTrack if args.native_mono else AudioSenderTrack
+    audio_sender_track = track_class(
+        shutdown_event=shutdown_event, capture_hub=capture_hub
+    )
+    audio_player = PacedAudioPlayer(speed=args.speed)
+    client = SoakClient(
+        audio_sender_track=audio_sender_track,
+        audio_player=audio_player,
+        offer_url=server.offer_url,
+        candidate_url=server.offer_url[: -len("/offer")] + "/candidate",
+        ice_server=None,
+        talk_mode="chat",
+        shutdown_event=shutdown_event,
+    )
+
+    monitor = SoakMonitor(interval=args.interval, speed=args.speed)
+    monitor.add_gauge(
+        "mixer_buffered",
+        lambda: sum(len(source.blocks) for source in audio_player.mixer.sources),
+    )
+    monitor.add_gauge("mixer_sources", lambda: len(audio_player.mixer.sources))
+    monitor.add_gauge(
+        "mixer_underruns",
+        lambda: sum(source.underruns for source in audio_player.mixer.sources),
+    )
+    monitor.add_gauge(
+        "capture_backlog",
+        lambda: capture_hub.ring.written - audio_sender_track.subscription.cursor,
+    )
+    # 送信側がリングの書き込みに追いつけずに捨てたブロック数。0でなければ負荷が高すぎる。
+    monitor.add_gauge("capture_dropped", lambda: audio_sender_track.subscription.dropped)
+    monitor.add_gauge("messages", lambda: client.messages)
+
+    monitor_event: Event = Event()
+    client_task = asyncio.create_task(client.run())
+    monitor_task = asyncio.create_task(monitor.run(monitor_event))
+    await watch_session(args, monitor, client_task, monitor_event)
+    await monitor_task
+
+    client_task.cancel()
+    await asyncio.gather(client_task, return_exceptions=True)
+    await client.close()
+    if audio_sender_track.subscription.dropped > 0:
+        monitor.invalidate(
+            f"{audio_sender_track.subscription.dropped} capture blocks dropped:"
+            f" the client could not keep up at --speed {args.speed}. Lower --speed."
+        )
+    audio_sender_track.close()
+    audio_player.close()
+    capture_hub.close()
+    server.close()
+
+    thresholds: dict[str, float] = {
+        "rss_mb": args.max_rss_growth,
+        "traced_mb": args.max_traced_growth,
+        "tasks": args.max_task_growth,
+        "mixer_buffered": args.max_queue_growth,
+        "capture_backlog": args.max_queue_growth,
+    }
+    report: dict = monitor.report(args.report, thresholds)
+    print(f"samples: {len(report['samples'])}, messages: {client.messages}")
+    print("trends per session hour (per wall-clock hour):")
+    for name, trend in report["trends_per_hour"].items():
+        wall_clock: float = report["trends_per_wall_clock_hour"][name]
+        print(f"  {name}: {trend:.3f} ({wall_clock:.3f})")
+    print("top allocators:")
+    for allocator in report["top_allocators"][:5]:
+        print(f"  {allocator['location']}: {allocator['size_diff_kb']:+.1f} KiB")
+    print(f"report: {args.report}")
+    if report["invalid"]:
+        print("INVALID:")
+        for reason in report["invalid"]:
+            print(f"  {reason}")
+    if report["failures"]:
+        print("FAILED:")
+        for failure in report["failures"]:
+            print(f"  {failure}")
+        return 1
+    if report["invalid"]:
+        return 2
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SincromisorClient soak test")
+    parser.add_argument("--duration", type=float, default=600.0, help="seconds")
+    parser.add_argument("--speed", type=float, default=2.0)
+    parser.add_argument("--interval", type=float, default=1.0)
+    parser.add_argument("--messages-per-second", type=float, default=20.0)
+    parser.add_argument("--native-mono", action="store_true")
+    parser.add_argument("--report", type=str, default="soak_report.json")
+    # 接続直後は受信トラックやメッセージが届くまで待つ
+    parser.add_argument("--startup-grace", type=float, default=10.0, help="seconds")
+    parser.add_argument("--stall-timeout", type=float, default=5.0, help="seconds")
+    # セッション時間(実時間の--speed倍)1時間あたりの許容増加量
+    parser.add_argument("--max-rss-growth", type=float, default=50.0, help="MB per session hour")
+    parser.add_argument("--max-traced-growth", type=float, default=20.0, help="MB per session hour")
+    parser.add_argument("--max-task-growth", type=float, default=100.0, help="tasks per session hour")
+    parser.add_argument("--max-queue-growth", type=float, default=100.0, help="blocks per session hour")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(soak(args)))
@@ -1,4 +1,6 @@
+import argparse
 import sounddevice as sd
+from src.SincromisorClient.DeviceLatencyProbe import DeviceLatencyProbe
 
 def show_device(idx, device):
     print(f"  Device {idx}:")
@@ -8,6 +10,44 @@ def show_device(idx, device):
     print(f"    Default Sample Rate: {device['default_samplerate']}")
     print()
 
+def show_probe_result(kind, result):
+    print(f"  {kind}:")
+    if "loopback" in result:
+        print(f"    loopback round trip: {result['loopback']['round_trip_latency']}s")
+    if "blocksizes" not in result:
+        return
+    for blocksize, measured in result["blocksizes"].items():
+        if measured["supported"]:
+            print(
+                f"    blocksize {blocksize}: latency={measured['latency']:.4f}s"
+                f" jitter(mean/max)={measured['jitter_mean'] * 1000:.2f}/{measured['jitter_max'] * 1000:.2f}ms"
+                f" xruns={measured['xruns']} stable={measured['stable']}"
+            )
+        else:
+            print(f"    blocksize {blocksize}: not supported ({measured['error']})")
+    for latency, measured in result["latencies"].items():
+        if measured["supported"]:
+            print(
+                f"    latency {latency}s: reported={measured['latency']:.4f}s"
+                f" jitter(mean/max)={measured['jitter_mean'] * 1000:.2f}/{measured['jitter_max'] * 1000:.2f}ms"
+                f" xruns={measured['xruns']} stable={measured['stable']}"
+            )
+        else:
+            print(f"    latency {latency}s: not supported ({measured['error']})")
+    print(f"    recommended latency: {result['recommended_latency']}")
+
+
+parser = argparse.ArgumentParser(description="List and probe sound devices")
+parser.add_argument("--probe", action="store_true", help="measure latency and jitter of each device")
+parser.add_argument("--device", type=int, default=None, help="probe only this device index")
+parser.add_argument("--cache", type=str, default="device_latency.json")
+parser.add_argument("--duration", type=float, default=1.0)
+parser.add_argument(
+    "--loopback", type=int, nargs=2, metavar=("INPUT", "OUTPUT"),
+    help="measure round trip latency of looped back input/output devices",
+)
+args = parser.parse_args()
+
 devices = sd.query_devices()
 input_devices = []
 output_devices = []
@@ -39,3 +79,19 @@ if default_odev_idx >= 0:
     show_device(default_odev_idx, devices[default_odev_idx])
 else:
     print('  None.')
+
+if args.probe:
+    probe = DeviceLatencyProbe(cache_path=args.cache, duration=args.duration)
+    print("\nProbing Devices:")
+    for key, results in probe.probe_all(device_idx=args.device).items():
+        print(f"{key}")
+        for kind, result in results.items():
+            show_probe_result(kind, result)
+    print(f"\nSaved to {args.cache}. Set `latency: auto` in config.yml to use the recommended latency.")
+
+if args.loopback:
+    probe = DeviceLatencyProbe(cache_path=args.cache, duration=args.duration)
+    round_trip = probe.probe_loopback(args.loopback[0], args.loopback[1])
+    print("\nLoopback Round Trip Latency:")
+    print(f"  {round_trip}s" if round_trip is not None else "  impulse not detected.")
+    print(f"Saved to {args.cache}.")
@@ -0,0 +1,138 @@
+import json
+import time
+import asyncio
+import logging
+from asyncio import Event
+from aiortc import RTCPeerConnection
+from .MonoOpusEncoder import MonoOpusEncoder
+
+
+class AdaptiveBitrateController:
+    # RTCPeerConnectionの統計(相手側からのReceiver Report)から
+    # RTT・パケットロス率・ジッタを読み取り、送信側Opusエンコーダの設定を切り替える。
+    # 先頭ほど高音質、末尾ほどロスに強い(低ビットレート・FEC強め・長いパケット)設定。
+    LEVELS: list[dict] = [
+        {"bitrate": 32000, "fec": False, "packet_loss": 0, "frame_duration": 20},
+        {"bitrate": 24000, "fec": True, "packet_loss": 10, "frame_duration": 20},
+        {"bitrate": 16000, "fec": True, "packet_loss": 20, "frame_duration": 40},
+        {"bitrate": 12000, "fec": True, "packet_loss": 30, "frame_duration": 60},
+        {"bitrate": 8000, "fec": True, "packet_loss": 40, "frame_duration": 60},
+    ]
+
+    def __init__(
+        self,
+        encoder: MonoOpusEncoder,
+        interval: float = 2.0,
+        level: int | None = None,
+        degrade_loss: float = 0.05,
+        degrade_rtt: float = 0.4,
+        degrade_jitter: float = 0.05,
+        upgrade_loss: float = 0.01,
+        upgrade_rtt: float = 0.2,
+        upgrade_jitter: float = 0.02,
+        degrade_count: int = 2,
+        upgrade_count: int = 5,
+        log_path: str | None = None,
+    ):
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.encoder: MonoOpusEncoder = encoder
+        self.interval: float = interval
+        # levelを省略した場合は、設定ファイルで指定された設定のまま送信を始め、
+        # ビットレートが最も近い段階から切り替えを始める。
+        self.level: int = self.nearest_level(encoder.bitrate) if level is None else level
+        self.degrade_loss: float = degrade_loss
+        self.degrade_rtt: float = degrade_rtt
+        self.degrade_jitter: float = degrade_jitter
+        self.upgrade_loss: float = upgrade_loss
+        self.upgrade_rtt: float = upgrade_rtt
+        self.upgrade_jitter: float = upgrade_jitter
+        # 一時的な揺らぎで設定がばたつかないよう、悪化はdegrade_count回、
+        # 改善はupgrade_count回連続で観測した時だけ段階を変える。
+        self.degrade_count: int = degrade_count
+        self.upgrade_count: int = upgrade_count
+        self.bad_streak: int = 0
+        self.good_streak: int = 0
+        self.log_path: str | None = log_path
+        self.last_report_at = None
+        if level is not None:
+            self.encoder.configure(**self.LEVELS[self.level])
+
+    @classmethod
+    def nearest_level(cls, bitrate: int) -> int:
+        return min(
+            range(len(cls.LEVELS)),
+            key=lambda idx: abs(cls.LEVELS[idx]["bitrate"] - bitrate),
+        )
+
+    def update(self, rtt: float, loss: float, jitter: float) -> dict | None:
+        # rtt, jitterは秒、lossは0.0-1.0。段階が変わった場合は新しい設定を返す。
+        if loss >= self.degrade_loss or rtt >= self.degrade_rtt or jitter >= self.degrade_jitter:
+            self.bad_streak += 1
+            self.good_streak = 0
+        elif loss <= self.upgrade_loss and rtt <= self.upgrade_rtt and jitter <= self.upgrade_jitter:
+            self.good_streak += 1
+            self.bad_streak = 0
+        else:
+            self.bad_streak = 0
+            self.good_streak = 0
+
+        previous_level: int = self.level
+        if self.bad_streak >= self.degrade_count and self.level < len(self.LEVELS) - 1:
+            self.level += 1
+        elif self.good_streak >= self.upgrade_count and self.level > 0:
+            self.level -= 1
+        if self.level != previous_level:
+            self.bad_streak = 0
+            self.good_streak = 0
+
+        settings: dict = self.LEVELS[self.level]
+        self.__log_decision(
+            {
+                "time": time.time(),
+                "rtt": rtt,
+                "loss": loss,
+                "jitter": jitter,
+                "previous_level": previous_level,
+                "level": self.level,
+                "settings": settings,
+            }
+        )
+        if self.level == previous_level:
+            return None
+        self.encoder.configure(**settings)
+        return settings
+
+    def __log_decision(self, decision: dict) -> None:
+        self.logger.info(["AdaptiveBitrate", decision])
+        if self.log_path is None:
+            return
+        with open(self.log_path, "a") as file:
+            file.write(json.dumps(decision) + "\n")
+
+    async def poll(self, rpc: RTCPeerConnection) -> dict | None:
+        report = await rpc.getStats()
+        for stats in report.values():
+            if stats.type != "remote-inbound-rtp" or stats.kind != "audio":
+                continue
+            # Receiver Reportが届いていなければ統計は更新されていない。
+            if stats.timestamp == self.last_report_at:
+                return None
+            self.last_report_at = stats.timestamp
+            return self.update(
+                # 送信側のSender Reportが相手に届くまではRTTが求まらない。
+                rtt=stats.roundTripTime or 0.0,
+                # RTCPのfraction lostは256分率
+                loss=stats.fractionLost / 256,
+                jitter=stats.jitter / self.encoder.samplerate,
+            )
+        return None
+
+    async def run(self, rpc: RTCPeerConnection, shutdown_event: Event) -> None:
+        while not shutdown_event.is_set():
+            await asyncio.sleep(self.interval)
+            if rpc.connectionState == "closed":
+                break
+            try:
+                await self.poll(rpc)
+            except Exception as e:
+                self.logger.error(["AdaptiveBitrateError", e])
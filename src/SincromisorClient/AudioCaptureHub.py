@@ -0,0 +1,162 @@
+import time
+import asyncio
+import numpy as np
+from multiprocessing import Event as ProcessEvent
+from multiprocessing.shared_memory import SharedMemory
+from .AudioRecorderProcess import AudioRecorderProcess
+
+
+class SharedAudioRing:
+    # 録音プロセスとの間で共有する、ブロック単位のリングバッファ。
+    # 先頭8バイトにこれまで書き込んだブロック数を置き、その後ろにslots個のブロックを並べる。
+    # 書き込みはAudioRecorderProcessの1か所だけで、読み込み側はそれぞれ自分の位置を持つ。
+    HEADER_SIZE: int = 8
+
+    def __init__(self, slots: int, frame_samples: int, name: str | None = None):
+        self.slots: int = slots
+        self.frame_samples: int = frame_samples
+        self.owner: bool = name is None
+        size: int = self.HEADER_SIZE + slots * frame_samples * 2
+        self.shm: SharedMemory = SharedMemory(name=name, create=self.owner, size=size)
+        self.__attach()
+        if self.owner:
+            self.counter[0] = 0
+
+    def __attach(self) -> None:
+        self.counter: np.ndarray = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self.blocks: np.ndarray = np.ndarray(
+            (self.slots, self.frame_samples),
+            dtype=np.int16,
+            buffer=self.shm.buf,
+            offset=self.HEADER_SIZE,
+        )
+
+    # spawnで子プロセスに渡す時は、名前で共有メモリに繋ぎ直す。
+    def __getstate__(self) -> dict:
+        return {"name": self.shm.name, "slots": self.slots, "frame_samples": self.frame_samples}
+
+    def __setstate__(self, state: dict) -> None:
+        self.slots = state["slots"]
+        self.frame_samples = state["frame_samples"]
+        self.owner = False
+        self.shm = SharedMemory(name=state["name"])
+        self.__attach()
+
+    @property
+    def written(self) -> int:
+        return int(self.counter[0])
+
+    def write(self, block: np.ndarray) -> None:
+        # ブロックを書き終えてからカウンタを進めるので、読み込み側が書きかけを読むことはない。
+        written: int = int(self.counter[0])
+        self.blocks[written % self.slots] = block.reshape(-1)
+        self.counter[0] = written + 1
+
+    def block(self, index: int) -> np.ndarray:
+        # コピーせずに共有メモリ上のビューを返す。
+        return self.blocks[index % self.slots]
+
+    def close(self) -> None:
+        del self.counter
+        del self.blocks
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class AudioCaptureSubscription:
+    # AudioCaptureHubの購読者ごとの読み込み位置。
+    # 読むのが遅れてリングを一周されそうになったら、古いブロックは捨てて最新に追いつく。
+    # 書き込み側も他の購読者も、遅い購読者を待つことはない。
+    def __init__(self, ring: SharedAudioRing, period: float = 0.02):
+        self.ring: SharedAudioRing = ring
+        # 1ブロック分の時間(blocksize / samplerate)
+        self.period: float = period
+        self.cursor: int = ring.written
+        self.next_block_at: float = time.monotonic()
+        self.dropped: int = 0
+        self.closed: bool = False
+
+    async def read(self, timeout: float = 0.05) -> np.ndarray | None:
+        # 短い間隔で共有メモリを見に行くとセッションごとにCPUを使うので、
+        # 次のブロックが届く頃まで寝て、まだ届いていなければ1/4ブロックずつ待つ。
+        deadline: float = time.monotonic() + timeout
+        while self.cursor >= self.ring.written:
+            now: float = time.monotonic()
+            if self.closed or now >= deadline:
+                return None
+            wait: float = self.next_block_at - now
+            if wait <= 0:
+                wait = self.period / 4
+            await asyncio.sleep(min(wait, deadline - now))
+
+        written: int = self.ring.written
+        # 書き込み中のスロットに追いつかれないよう、1スロット分の余裕を残す。
+        if written - self.cursor >= self.ring.slots - 1:
+            self.dropped += written - 1 - self.cursor
+            self.cursor = written - 1
+        block: np.ndarray = self.ring.block(self.cursor)
+        self.cursor += 1
+        if self.cursor == written:
+            # 最新のブロックを読んだので、次は1ブロック分後に届く。
+            self.next_block_at = time.monotonic() + self.period
+        return block
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class AudioCaptureHub:
+    # 1つの入力デバイスを1つの録音プロセスで開き、複数のAudioSenderTrackに配る。
+    # 複数のアバターを同時に動かす場合や、再接続でセッションが重なる場合でも
+    # デバイスを開き直したり、録音プロセスを増やしたりせずに済む。
+    def __init__(
+        self,
+        channels: int = 1,
+        samplerate: int = 48000,
+        dtype: str = "int16",
+        blocksize: int = 960,
+        device: str = "default",
+        latency: float | str | None = None,
+        slots: int = 50,
+    ):
+        self.channels: int = channels
+        self.samplerate: int = samplerate
+        self.blocksize: int = blocksize
+        self.ring: SharedAudioRing = SharedAudioRing(
+            slots=slots, frame_samples=blocksize * channels
+        )
+        self.shutdown_event = ProcessEvent()
+        self.subscriptions: list[AudioCaptureSubscription] = []
+        self.audio_p = AudioRecorderProcess(
+            voice_queue=None,
+            ring=self.ring,
+            channels=channels,
+            samplerate=samplerate,
+            dtype=dtype,
+            blocksize=blocksize,
+            device=device,
+            latency=latency,
+            shutdown_event=self.shutdown_event,
+        )
+        self.audio_p.start()
+
+    def subscribe(self) -> AudioCaptureSubscription:
+        subscription = AudioCaptureSubscription(
+            self.ring, period=self.blocksize / self.samplerate
+        )
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: AudioCaptureSubscription) -> None:
+        subscription.close()
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+
+    def close(self) -> None:
+        for subscription in self.subscriptions:
+            subscription.close()
+        self.shutdown_event.set()
+        self.audio_p.join()
+        self.audio_p.close()
+        self.ring.close()
@@ -0,0 +1,150 @@
+import numpy as np
+from collections import deque
+
+
+class AudioMixerSource:
+    # 受信トラック1本分のジッタバッファ。
+    # 届いたフレームをblocksize単位に切り分けて溜め、prebufferブロック溜まってから再生を始める。
+    # 溜まりすぎたら古いものから捨て、空になったら(アンダーラン)溜め直す。
+    def __init__(
+        self,
+        name: str,
+        blocksize: int = 960,
+        channels: int = 2,
+        gain: float = 1.0,
+        prebuffer: int = 2,
+        capacity: int = 6,
+    ):
+        self.name: str = name
+        self.block_samples: int = blocksize * channels
+        self.gain: float = gain
+        self.prebuffer: int = prebuffer
+        # dequeのappend/popleftはスレッドセーフなので、
+        # asyncio側からpushし、PortAudioのコールバックからpopできる。
+        self.blocks: deque = deque(maxlen=capacity)
+        self.pending: np.ndarray = np.zeros(0, dtype=np.int16)
+        self.playing: bool = False
+        self.underruns: int = 0
+        self.overflows: int = 0
+        # max_sourcesを超えたためにミックスされずに捨てたブロック数
+        self.skipped: int = 0
+        self.level_dbfs: float = -np.inf
+        self.peak: int = 0
+
+    def push(self, frame: np.ndarray) -> None:
+        samples: np.ndarray = frame.reshape(-1)
+        if len(self.pending) > 0:
+            samples = np.concatenate((self.pending, samples))
+        full: int = len(samples) // self.block_samples * self.block_samples
+        for offset in range(0, full, self.block_samples):
+            if len(self.blocks) == self.blocks.maxlen:
+                self.overflows += 1
+            self.blocks.append(samples[offset:offset + self.block_samples])
+        self.pending = samples[full:]
+
+    def pop(self) -> np.ndarray | None:
+        if not self.playing:
+            if len(self.blocks) < self.prebuffer:
+                return None
+            self.playing = True
+        try:
+            return self.blocks.popleft()
+        except IndexError:
+            self.underruns += 1
+            self.playing = False
+            return None
+
+    def metrics(self) -> dict:
+        return {
+            "level_dbfs": self.level_dbfs,
+            "peak": self.peak,
+            "buffered": len(self.blocks),
+            "underruns": self.underruns,
+            "overflows": self.overflows,
+            "skipped": self.skipped,
+        }
+
+
+class AudioMixer:
+    # 複数の受信トラックを1つの出力デバイス向けにミックスする。
+    # PortAudioのコールバックから呼ばれるので、配列は最初に確保したものを使い回し、
+    # 1回のmixで足し合わせるソースはmax_sources個までに抑える。
+    # それを超えたソースもブロックは取り出して捨て、ジッタバッファが溢れ続けないようにする。
+    def __init__(self, blocksize: int = 960, channels: int = 2, max_sources: int = 8):
+        self.blocksize: int = blocksize
+        self.channels: int = channels
+        self.max_sources: int = max_sources
+        block_samples: int = blocksize * channels
+        # ソースの追加・削除はタプルごと差し替えて、コールバック中の反復と競合しないようにする。
+        self.sources: tuple[AudioMixerSource, ...] = ()
+        self.stack: np.ndarray = np.zeros((max_sources, block_samples), dtype=np.float32)
+        self.gains: np.ndarray = np.zeros(max_sources, dtype=np.float32)
+        self.mixed: np.ndarray = np.zeros(block_samples, dtype=np.float32)
+        self.output: np.ndarray = np.zeros(block_samples, dtype=np.int16)
+
+    def add_source(
+        self, name: str, gain: float = 1.0, prebuffer: int = 2, capacity: int = 6
+    ) -> AudioMixerSource:
+        source = AudioMixerSource(
+            name=name,
+            blocksize=self.blocksize,
+            channels=self.channels,
+            gain=gain,
+            prebuffer=prebuffer,
+            capacity=capacity,
+        )
+        self.sources = self.sources + (source,)
+        return source
+
+    def remove_source(self, source: AudioMixerSource) -> None:
+        self.sources = tuple(s for s in self.sources if s is not source)
+
+    def mix(self) -> np.ndarray:
+        count: int = 0
+        mixed_sources: list[AudioMixerSource] = []
+        for source in self.sources:
+            block: np.ndarray | None = source.pop()
+            if block is None:
+                source.level_dbfs = -np.inf
+                source.peak = 0
+                continue
+            if count == self.max_sources:
+                # ミックスはしないが、音は届いているので音量は測っておく。
+                source.skipped += 1
+                self.__measure_skipped(source, block)
+                continue
+            self.stack[count] = block
+            self.gains[count] = source.gain
+            mixed_sources.append(source)
+            count += 1
+
+        if count == 0:
+            self.output.fill(0)
+            return self.output
+
+        stack: np.ndarray = self.stack[:count]
+        gains: np.ndarray = self.gains[:count]
+        # float32で足し合わせてから丸めてクリップするので、int16の桁あふれで音が割れることはない。
+        np.matmul(gains, stack, out=self.mixed)
+        np.rint(self.mixed, out=self.mixed)
+        np.clip(self.mixed, -32768, 32767, out=self.mixed)
+        np.copyto(self.output, self.mixed, casting="unsafe")
+
+        rms: np.ndarray = np.sqrt(np.einsum("ij,ij->i", stack, stack) / stack.shape[1]) * np.abs(gains)
+        peaks: np.ndarray = np.max(np.abs(stack), axis=1) * np.abs(gains)
+        with np.errstate(divide="ignore"):
+            levels: np.ndarray = 20 * np.log10(rms / 32768)
+        for idx, source in enumerate(mixed_sources):
+            source.level_dbfs = float(levels[idx])
+            source.peak = int(peaks[idx])
+        return self.output
+
+    def __measure_skipped(self, source: AudioMixerSource, block: np.ndarray) -> None:
+        samples: np.ndarray = block.astype(np.float32)
+        rms: float = float(np.sqrt(np.dot(samples, samples) / len(samples))) * abs(source.gain)
+        with np.errstate(divide="ignore"):
+            source.level_dbfs = float(20 * np.log10(rms / 32768))
+        source.peak = int(np.max(np.abs(samples)) * abs(source.gain))
+
+    def metrics(self) -> dict:
+        return {source.name: source.metrics() for source in self.sources}
@@ -1,8 +1,9 @@
+import time
 import sounddevice as sd
 import numpy as np
 import sys
-from queue import Queue, Empty
 from av.audio.frame import AudioFrame
+from .AudioMixer import AudioMixer, AudioMixerSource
 
 
 class AudioPlayer:
@@ -13,6 +14,8 @@ class AudioPlayer:
         dtype: str = "int16",
         blocksize: int = 960,
         device: str = "default",
+        latency: float | str | None = None,
+        max_sources: int = 8,
     ):
         self.start_idx: int = 0
         self.channels: int = channels
@@ -20,35 +23,54 @@ class AudioPlayer:
         self.dtype: str = dtype
         self.device: str = device
         self.blocksize: int = blocksize
-        self.queue: Queue = Queue(3)
-        self.audio_output = sd.OutputStream(
+        self.latency: float | str | None = latency
+        # 受信トラックごとにソースを分けてミックスする。
+        # ソースを指定せずに追加したフレームはdefault_sourceに入る。
+        self.mixer: AudioMixer = AudioMixer(
+            blocksize=self.blocksize, channels=self.channels, max_sources=max_sources
+        )
+        self.default_source: AudioMixerSource | None = None
+        self.audio_output = self._open_output_stream(self.__callback)
+        self.started: bool = False
+        print("start AudioPlayer")
+
+    def _open_output_stream(self, callback) -> sd.OutputStream:
+        return sd.OutputStream(
             channels=self.channels,
             samplerate=self.samplerate,
             dtype=self.dtype,
             blocksize=self.blocksize,
             device=self.device,
-            callback=self.__callback,
+            latency=self.latency,
+            callback=callback,
         )
-        self.started: bool = False
-        print("start AudioPlayer")
 
     def __callback(
         self, outdata: np.ndarray, frames: int, time, status: sd.CallbackFlags
     ) -> None:
-        outdata.fill(0)
-        try:
-            frame: np.ndarray = self.queue.get_nowait()
-        except Empty:
-            return
-        outdata[:] = frame.reshape((self.blocksize, self.channels))
+        outdata[:] = self.mixer.mix().reshape((self.blocksize, self.channels))
+
+    def add_source(self, name: str, gain: float = 1.0) -> AudioMixerSource:
+        return self.mixer.add_source(name=name, gain=gain)
+
+    def remove_source(self, source: AudioMixerSource) -> None:
+        self.mixer.remove_source(source)
 
-    def add_frame(self, frame: AudioFrame):
+    def metrics(self) -> dict:
+        return self.mixer.metrics()
+
+    def add_frame(self, frame: AudioFrame, source: AudioMixerSource | None = None):
         array = frame.to_ndarray()
-        self.queue.put(array)
-        self.__ensure_started()
+        self.add_numpy_frame(array, source)
 
-    def add_numpy_frame(self, frame: np.ndarray):
-        self.queue.put(frame)
+    def add_numpy_frame(
+        self, frame: np.ndarray, source: AudioMixerSource | None = None
+    ):
+        if source is None:
+            if self.default_source is None:
+                self.default_source = self.add_source("default")
+            source = self.default_source
+        source.push(frame)
         self.__ensure_started()
 
     def __ensure_started(self) -> None:
@@ -69,7 +91,13 @@ if __name__ == "__main__":
     try:
         square_wave = SquareWave()
         ap = AudioPlayer(blocksize=960)
+        source = ap.add_source("square_wave")
         while True:
-            ap.add_numpy_frame(square_wave.generate(960))
+            # ジッタバッファが溢れないよう、再生が進むのを待ってから足す。
+            while len(source.blocks) >= 4:
+                time.sleep(0.005)
+            ap.add_numpy_frame(
+                np.repeat(square_wave.generate(960), 2, axis=1).astype(np.int16), source
+            )
     except KeyboardInterrupt:
         sys.exit(1)
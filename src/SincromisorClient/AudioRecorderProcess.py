@@ -7,15 +7,18 @@ import sounddevice as sd
 
 
 class AudioRecorderProcess(Process):
+    # voice_queueの代わりにring(SharedAudioRing)を渡すと、共有メモリに書き込む。
     def __init__(
         self,
-        voice_queue: Queue,
+        voice_queue: Queue = None,
         channels: int = 1,
         samplerate: int = 48000,
         dtype: str = "int16",
         blocksize=960,
         device: str = "default",
+        latency: float | str | None = None,
         shutdown_event: Event = Event(),
+        ring=None,
     ):
         Process.__init__(self)
         self.channels: int = channels
@@ -23,7 +26,9 @@ class AudioRecorderProcess(Process):
         self.dtype: str = dtype
         self.device: str = device
         self.blocksize: int = blocksize
+        self.latency: float | str | None = latency
         self.voice_queue: Queue = voice_queue
+        self.ring = ring
         self.shutdown_event: Event = shutdown_event
 
     def run(self) -> None:
@@ -36,6 +41,7 @@ class AudioRecorderProcess(Process):
                 self.dtype,
                 self.blocksize,
                 self.device,
+                self.latency,
             ]
         )
         sound_input = sd.InputStream(
@@ -44,6 +50,7 @@ class AudioRecorderProcess(Process):
             dtype=self.dtype,
             blocksize=self.blocksize,
             device=self.device,
+            latency=self.latency,
             callback=self.__recorder_callback,
         )
         sound_input.start()
@@ -59,6 +66,9 @@ class AudioRecorderProcess(Process):
     def __recorder_callback(
         self, outdata: np.ndarray, frames: int, time, status: sd.CallbackFlags
     ):
+        if self.ring is not None:
+            self.ring.write(outdata)
+            return
         try:
             # ndarrayをそのまま送ると壊れるのでbytesにする。
             self.voice_queue.put(outdata.tobytes())
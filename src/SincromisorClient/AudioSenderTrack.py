@@ -1,3 +1,4 @@
+import asyncio
 import numpy as np
 from aiortc import AudioStreamTrack
 from multiprocessing import Queue
@@ -6,6 +7,7 @@ from asyncio import Event
 from av.audio.frame import AudioFrame
 from fractions import Fraction
 from .AudioRecorderProcess import AudioRecorderProcess
+from .AudioCaptureHub import AudioCaptureHub, AudioCaptureSubscription
 
 
 class AudioSenderTrack(AudioStreamTrack):
@@ -16,15 +18,22 @@ class AudioSenderTrack(AudioStreamTrack):
         dtype: str = "int16",
         blocksize: int = 960,
         device: str = "default",
+        latency: float | str | None = None,
         shutdown_event: Event = Event(),
+        capture_hub: AudioCaptureHub | None = None,
     ):
         super().__init__()
         self.shutdown_event: Event = shutdown_event
-        self.voice_queue: Queue = Queue(3)
         self.timestamp: int = 0
         self.samplerate: int = samplerate
         self.blocksize: int = blocksize
-        print(["AudioSenderTrack", channels, samplerate, dtype, blocksize, device])
+        print(["AudioSenderTrack", channels, samplerate, dtype, blocksize, device, latency])
+        # capture_hubを渡した場合は、自分では録音プロセスを起動せずにhubから受け取る。
+        self.capture_hub: AudioCaptureHub | None = capture_hub
+        if self.capture_hub is not None:
+            self.subscription: AudioCaptureSubscription = self.capture_hub.subscribe()
+            return
+        self.voice_queue: Queue = Queue(3)
         self.audio_p = AudioRecorderProcess(
             voice_queue=self.voice_queue,
             channels=channels,
@@ -32,6 +41,7 @@ class AudioSenderTrack(AudioStreamTrack):
             dtype=dtype,
             blocksize=blocksize,
             device=device,
+            latency=latency,
             shutdown_event=self.shutdown_event,
         )
         self.audio_p.start()
@@ -43,17 +53,7 @@ class AudioSenderTrack(AudioStreamTrack):
     # _next_encoded_frameのawait self.__track.recv()が永遠に待ち続けてしまい、
     # 適切に終了できなくなる。
     async def recv(self):
-        try:
-            # 0.02秒ごとに1ブロックのサンプルが得られるはずなので、
-            # 0.05秒ぐらい待ってダメそうならダミーデータを送る
-            byte_frame: bytes = self.voice_queue.get(block=True, timeout=0.05)
-        except Empty:
-            # 音声データが無い時はダミーのフレームを返す
-            byte_frame: bytes = b"\0" * 960 * 2
-        except Exception as e:
-            print(f"recv_exception {e}")
-            byte_frame: bytes = b"\0" * 960 * 2
-        np_frame: np.ndarray = np.frombuffer(byte_frame, dtype=np.int16)
+        np_frame: np.ndarray = await self._read_block()
         frame = AudioFrame.from_ndarray(
             np_frame.reshape(1, self.blocksize), format="s16", layout="mono"
         )
@@ -63,7 +63,32 @@ class AudioSenderTrack(AudioStreamTrack):
         frame.sample_rate = self.samplerate
         return frame
 
+    async def _read_block(self) -> np.ndarray:
+        if self.capture_hub is not None:
+            block: np.ndarray | None = await self.subscription.read(timeout=0.05)
+            if block is None:
+                return np.zeros(self.blocksize, dtype=np.int16)
+            return block
+        try:
+            # 0.02秒ごとに1ブロックのサンプルが得られるはずなので、
+            # 0.05秒ぐらい待ってダメそうならダミーデータを送る。
+            # Queue.getはブロックするので、イベントループを止めないよう別スレッドで待つ。
+            byte_frame: bytes = await asyncio.to_thread(
+                self.voice_queue.get, block=True, timeout=0.05
+            )
+        except Empty:
+            # 音声データが無い時はダミーのフレームを返す
+            byte_frame: bytes = b"\0" * self.blocksize * 2
+        except Exception as e:
+            print(f"recv_exception {e}")
+            byte_frame: bytes = b"\0" * self.blocksize * 2
+        return np.frombuffer(byte_frame, dtype=np.int16)
+
     def close(self):
+        if self.capture_hub is not None:
+            # hubは他のトラックも使っているので、購読をやめるだけにする。
+            self.capture_hub.unsubscribe(self.subscription)
+            return
         if not self.shutdown_event.is_set():
             self.shutdown_event.set()
         self.audio_p.join()
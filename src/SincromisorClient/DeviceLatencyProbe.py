@@ -0,0 +1,197 @@
+import os
+import json
+import time
+import numpy as np
+import sounddevice as sd
+
+
+class DeviceLatencyProbe:
+    # 各サウンドデバイスを実際に開いて、PortAudioが報告する入出力レイテンシ、
+    # 開けるブロックサイズ、コールバック間隔のゆらぎ(ジッタ)を測定する。
+    # 結果は「デバイス名, ホストAPI名」(config.ymlのdeviceと同じ形式)をキーにしてキャッシュし、
+    # config.ymlでlatency: autoとした時に推奨値として使う。
+    def __init__(
+        self,
+        cache_path: str = "device_latency.json",
+        samplerate: int = 48000,
+        dtype: str = "int16",
+        blocksize: int = 960,
+        blocksizes: tuple[int, ...] = (240, 480, 960, 1920),
+        latencies: tuple[float, ...] = (0.2, 0.1, 0.06, 0.04, 0.03, 0.02, 0.01, 0.005),
+        duration: float = 1.0,
+    ):
+        self.cache_path: str = cache_path
+        self.samplerate: int = samplerate
+        self.dtype: str = dtype
+        self.blocksize: int = blocksize
+        self.blocksizes: tuple[int, ...] = blocksizes
+        # 大きい順に試し、安定して動いた最小のものを推奨値にする。
+        self.latencies: tuple[float, ...] = tuple(sorted(latencies, reverse=True))
+        self.duration: float = duration
+
+    @staticmethod
+    def device_key(device: dict) -> str:
+        return device["name"] + ", " + sd.query_hostapis()[device["hostapi"]]["name"]
+
+    def load_cache(self) -> dict:
+        if not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path, "r") as file:
+            return json.load(file)
+
+    def save_cache(self, cache: dict) -> None:
+        with open(self.cache_path, "w") as file:
+            json.dump(cache, file, indent=2, ensure_ascii=False)
+
+    def recommended_latency(self, device_key: str, kind: str) -> float | None:
+        result: dict | None = self.load_cache().get(device_key, {}).get(kind)
+        if result is None:
+            return None
+        return result.get("recommended_latency")
+
+    def measure_stream(
+        self, kind: str, device: int, channels: int, blocksize: int, latency
+    ) -> dict:
+        callback_times: list[float] = []
+        xruns: list[int] = [0]
+
+        def callback(*args) -> None:
+            # InputStreamは(indata, frames, time, status)、
+            # OutputStreamは(outdata, frames, time, status)で呼ばれる。
+            callback_times.append(time.perf_counter())
+            if kind == "output":
+                args[0].fill(0)
+            if args[-1]:
+                xruns[0] += 1
+
+        stream_class = sd.InputStream if kind == "input" else sd.OutputStream
+        try:
+            stream = stream_class(
+                device=device,
+                channels=channels,
+                samplerate=self.samplerate,
+                dtype=self.dtype,
+                blocksize=blocksize,
+                latency=latency,
+                callback=callback,
+            )
+            # デバイスが使用中の場合などは、開始(start)の時点で失敗することもある。
+            with stream:
+                time.sleep(self.duration)
+        except sd.PortAudioError as e:
+            return {"supported": False, "error": str(e)}
+        reported_latency: float = stream.latency
+
+        period: float = blocksize / self.samplerate
+        intervals: np.ndarray = np.diff(np.array(callback_times))
+        # 最初の数回はストリーム開始直後で不安定なので除く。
+        intervals = intervals[2:]
+        if len(intervals) == 0:
+            return {"supported": False, "error": "no callback"}
+        jitter: np.ndarray = np.abs(intervals - period)
+        return {
+            "supported": True,
+            "latency": reported_latency,
+            "callbacks": len(callback_times),
+            "xruns": xruns[0],
+            "jitter_mean": float(jitter.mean()),
+            "jitter_max": float(jitter.max()),
+            # xrunが無く、コールバックの遅れが1ブロック分に収まっていれば安定とみなす。
+            "stable": xruns[0] == 0 and float(jitter.max()) < period,
+        }
+
+    def probe_device(self, device_idx: int, kind: str) -> dict:
+        # 送信(マイク)はモノラル、受信(スピーカー)はステレオで使う。
+        channels: int = 1 if kind == "input" else 2
+        blocksizes: dict = {}
+        for blocksize in self.blocksizes:
+            result = self.measure_stream(kind, device_idx, channels, blocksize, "low")
+            blocksizes[str(blocksize)] = result
+        stable_blocksizes: list[int] = [
+            int(blocksize) for blocksize, result in blocksizes.items() if result.get("stable")
+        ]
+        min_stable_blocksize: int | None = min(stable_blocksizes, default=None)
+
+        # 実際に使うブロックサイズで、指定するレイテンシを大きい順に下げていく。
+        # 安定して動いた最小のブロックサイズの1周期より短いレイテンシは、
+        # コールバックが間に合わないので試さない。
+        floor: float = 0.0
+        if min_stable_blocksize is not None:
+            floor = min_stable_blocksize / self.samplerate
+        latencies: dict = {}
+        recommended_latency: float | None = None
+        for latency in self.latencies:
+            if latency < floor:
+                break
+            result = self.measure_stream(kind, device_idx, channels, self.blocksize, latency)
+            latencies[str(latency)] = result
+            if result.get("stable"):
+                recommended_latency = latency
+            elif recommended_latency is not None:
+                # これより小さいレイテンシで安定することはまず無いので打ち切る。
+                break
+
+        return {
+            "device": device_idx,
+            "blocksizes": blocksizes,
+            "min_stable_blocksize": min_stable_blocksize,
+            "latencies": latencies,
+            "recommended_latency": recommended_latency,
+            "probed_at": time.time(),
+        }
+
+    def probe_all(self, device_idx: int | None = None) -> dict:
+        cache: dict = self.load_cache()
+        for idx, device in enumerate(sd.query_devices()):
+            if device_idx is not None and idx != device_idx:
+                continue
+            key: str = self.device_key(device)
+            for kind, available in (
+                ("input", device["max_input_channels"] > 0),
+                ("output", device["max_output_channels"] > 1),
+            ):
+                if not available:
+                    continue
+                previous: dict = cache.setdefault(key, {}).get(kind, {})
+                result: dict = self.probe_device(idx, kind)
+                # 以前に測ったループバックの結果は測り直すまで残す。
+                if "loopback" in previous:
+                    result["loopback"] = previous["loopback"]
+                cache[key][kind] = result
+        self.save_cache(cache)
+        return cache
+
+    def measure_round_trip(self, input_device: int, output_device: int) -> float | None:
+        # 出力と入力をループバック接続(ケーブルやループバックデバイス)した状態で、
+        # インパルスを鳴らしてから録音に現れるまでの時間を実測する。
+        length: int = int(self.samplerate * max(self.duration, 1.0))
+        signal: np.ndarray = np.zeros((length, 2), dtype=np.int16)
+        signal[self.blocksize, :] = np.iinfo(np.int16).max
+        recorded: np.ndarray = sd.playrec(
+            signal,
+            samplerate=self.samplerate,
+            channels=1,
+            dtype=self.dtype,
+            device=(input_device, output_device),
+            latency="low",
+            blocking=True,
+        )
+        peak: int = int(np.argmax(np.abs(recorded[:, 0].astype(np.int32))))
+        if recorded[peak, 0] == 0:
+            return None
+        return (peak - self.blocksize) / self.samplerate
+
+    def probe_loopback(self, input_device: int, output_device: int) -> float | None:
+        # 実測した往復の遅延を、入力・出力それぞれの推奨レイテンシと並べてキャッシュに残す。
+        round_trip: float | None = self.measure_round_trip(input_device, output_device)
+        cache: dict = self.load_cache()
+        loopback: dict = {
+            "input": self.device_key(sd.query_devices(input_device)),
+            "output": self.device_key(sd.query_devices(output_device)),
+            "round_trip_latency": round_trip,
+            "measured_at": time.time(),
+        }
+        cache.setdefault(loopback["input"], {}).setdefault("input", {})["loopback"] = loopback
+        cache.setdefault(loopback["output"], {}).setdefault("output", {})["loopback"] = loopback
+        self.save_cache(cache)
+        return round_trip
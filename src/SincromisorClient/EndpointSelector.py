@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import requests
+from aiortc import RTCPeerConnection, RTCConfiguration, RTCIceServer
+from .SincromisorConfig import SignalingEndpointConfig
+from .ServerConfigCache import ServerConfigCache
+
+
+class EndpointSelector:
+    # 複数のSincromisorサーバーに同時に問い合わせ、応答の速い順に並べる。
+    # config_urlがあればconfig.jsonの取得時間を、なければoffer_urlへのHEADの応答時間をRTTとし、
+    # 結果はcache_pathにキャッシュし、取得したconfig.jsonはServerConfigCacheに保存する。
+    def __init__(
+        self,
+        endpoints: list[SignalingEndpointConfig],
+        server_config_cache: ServerConfigCache,
+        cache_path: str = "endpoint_probe.json",
+        ttl: float = 300.0,
+        timeout: float = 3.0,
+        ice_probe: bool = False,
+    ):
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.endpoints: list[SignalingEndpointConfig] = endpoints
+        self.server_config_cache: ServerConfigCache = server_config_cache
+        self.cache_path: str = cache_path
+        self.ttl: float = ttl
+        self.timeout: float = timeout
+        self.ice_probe: bool = ice_probe
+
+    def load_cache(self) -> dict:
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            self.logger.warning(["EndpointProbeCacheError", e])
+            return {}
+
+    def save_cache(self, cache: dict) -> None:
+        with open(self.cache_path, "w") as file:
+            json.dump(cache, file, indent=2)
+
+    def is_fresh(self, result: dict | None) -> bool:
+        # 失敗した結果はキャッシュせず、毎回測り直す。
+        if result is None or not result.get("healthy"):
+            return False
+        return time.time() - result["probed_at"] < self.ttl
+
+    async def select(self) -> list[SignalingEndpointConfig]:
+        # 1つしかなければ比べる必要はない。
+        if len(self.endpoints) == 1:
+            return self.endpoints
+
+        cache: dict = self.load_cache()
+        stale: list[SignalingEndpointConfig] = [
+            endpoint
+            for endpoint in self.endpoints
+            if not self.is_fresh(cache.get(endpoint.key))
+        ]
+        results: list[dict] = await asyncio.gather(
+            *[self.probe(endpoint) for endpoint in stale]
+        )
+        for endpoint, result in zip(stale, results):
+            cache[endpoint.key] = result
+        if stale:
+            self.save_cache(cache)
+
+        # offer/candidate/ICE設定は、接続する時にServerConfigCacheから最新のものを補完する。
+        ranked: list[SignalingEndpointConfig] = sorted(
+            [endpoint for endpoint in self.endpoints if cache[endpoint.key]["healthy"]],
+            key=lambda endpoint: cache[endpoint.key]["http_rtt"]
+            + (cache[endpoint.key]["ice_rtt"] or 0.0),
+        )
+        self.logger.info(
+            [
+                "EndpointRanking",
+                [
+                    (endpoint.key, cache[endpoint.key]["http_rtt"], cache[endpoint.key]["ice_rtt"])
+                    for endpoint in ranked
+                ],
+            ]
+        )
+        return ranked
+
+    def mark_failed(self, endpoint: SignalingEndpointConfig) -> None:
+        # offerに失敗したりセッションが切れたサーバーは、次回起動時に測り直す。
+        cache: dict = self.load_cache()
+        if endpoint.key in cache:
+            cache[endpoint.key]["healthy"] = False
+            self.save_cache(cache)
+
+    async def probe(self, endpoint: SignalingEndpointConfig) -> dict:
+        result: dict = {
+            "key": endpoint.key,
+            "healthy": False,
+            "http_rtt": None,
+            "ice_rtt": None,
+            "probed_at": time.time(),
+        }
+        try:
+            start: float = time.perf_counter()
+            if endpoint.config_url is not None:
+                # ETagで再検証するので、変更が無ければ中身は転送されない。
+                server_config: dict = await asyncio.to_thread(
+                    self.server_config_cache.fetch,
+                    str(endpoint.config_url),
+                    self.timeout,
+                )
+                result["http_rtt"] = time.perf_counter() - start
+                resolved = endpoint.resolve(self.server_config_cache, server_config)
+            else:
+                await asyncio.to_thread(self.__head, str(endpoint.offer_url))
+                result["http_rtt"] = time.perf_counter() - start
+                resolved = endpoint.resolve(self.server_config_cache)
+        except Exception as e:
+            # offer_urlやICEサーバーが揃わない場合も、resolveのValueErrorでここに来る。
+            self.logger.warning(["EndpointProbeError", endpoint.key, e])
+            result["error"] = str(e)
+            return result
+
+        if self.ice_probe:
+            result["ice_rtt"] = await self.__probe_ice(resolved)
+            if result["ice_rtt"] is None:
+                result["error"] = "ICE gathering timed out."
+                return result
+        result["healthy"] = True
+        return result
+
+    def __head(self, url: str) -> None:
+        # offerはPOSTのみだが、サーバーが応答するかどうかとRTTはHEADで分かる。
+        response = requests.head(url, timeout=self.timeout)
+        if response.status_code >= 500:
+            raise ConnectionError(f"Endpoint response was invalid - {response.status_code}")
+
+    async def __probe_ice(self, endpoint: SignalingEndpointConfig) -> float | None:
+        # STUN/TURNサーバーから候補を集め終わるまでの時間を測る。
+        rpc = RTCPeerConnection(
+            configuration=RTCConfiguration(
+                iceServers=[
+                    RTCIceServer(
+                        urls=conf["urls"],
+                        username=conf.get("username"),
+                        credential=conf.get("credential"),
+                    )
+                    for conf in endpoint.resolved_ice_servers
+                ]
+            )
+        )
+        rpc.createDataChannel("probe")
+        try:
+            start: float = time.perf_counter()
+            await asyncio.wait_for(
+                rpc.setLocalDescription(await rpc.createOffer()), self.timeout
+            )
+            return time.perf_counter() - start
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            await rpc.close()
@@ -0,0 +1,96 @@
+import numpy as np
+from av import CodecContext
+from av.audio.frame import AudioFrame
+from av.packet import Packet
+from fractions import Fraction
+
+
+class MonoOpusEncoder:
+    # aiortcのOpusEncoderは48000Hz/2chへリサンプルしてからエンコードするが、
+    # マイク入力はモノラルの音声なので、そのままモノラルのOpusとしてエンコードする。
+    # Opusのストリームはモノラルでも opus/48000/2 のRTPペイロードとして送ってよい。
+    SUPPORTED_FRAME_DURATIONS: tuple[int, ...] = (20, 40, 60)
+
+    def __init__(
+        self,
+        samplerate: int = 48000,
+        bitrate: int = 24000,
+        complexity: int = 3,
+        fec: bool = True,
+        dtx: bool = False,
+        packet_loss: int = 10,
+        frame_duration: int = 20,
+    ):
+        self.samplerate: int = samplerate
+        self.time_base: Fraction = Fraction(1, samplerate)
+        self.bitrate: int = bitrate
+        self.complexity: int = complexity
+        self.fec: bool = fec
+        self.dtx: bool = dtx
+        self.packet_loss: int = packet_loss
+        self.frame_duration: int = frame_duration
+        self.codec: CodecContext = self.__create_codec()
+
+    def __create_codec(self) -> CodecContext:
+        if self.frame_duration not in self.SUPPORTED_FRAME_DURATIONS:
+            raise ValueError(f"unsupported frame_duration: {self.frame_duration}")
+        codec = CodecContext.create("libopus", "w")
+        codec.bit_rate = self.bitrate
+        codec.format = "s16"
+        codec.layout = "mono"
+        codec.sample_rate = self.samplerate
+        codec.time_base = self.time_base
+        codec.options = {
+            "application": "voip",
+            "compression_level": str(self.complexity),
+            "fec": "1" if self.fec else "0",
+            "dtx": "1" if self.dtx else "0",
+            "packet_loss": str(self.packet_loss),
+            "frame_duration": str(self.frame_duration),
+        }
+        return codec
+
+    @property
+    def frame_samples(self) -> int:
+        # 1パケットに含めるサンプル数(20msなら960)
+        return self.samplerate * self.frame_duration // 1000
+
+    def settings(self) -> dict:
+        return {
+            "bitrate": self.bitrate,
+            "complexity": self.complexity,
+            "fec": self.fec,
+            "dtx": self.dtx,
+            "packet_loss": self.packet_loss,
+            "frame_duration": self.frame_duration,
+        }
+
+    def configure(self, **settings) -> bool:
+        # libopusのパラメータはopen後に変更できないので、
+        # 設定が変わった場合はCodecContextを作り直す。
+        changed: bool = False
+        for key, value in settings.items():
+            if key not in self.settings():
+                raise ValueError(f"unknown encoder setting: {key}")
+            if getattr(self, key) != value:
+                setattr(self, key, value)
+                changed = True
+        if changed:
+            self.codec = self.__create_codec()
+        return changed
+
+    def encode(self, samples: np.ndarray, pts: int) -> list[Packet]:
+        # samplesはframe_samples個のint16モノラルサンプル。
+        # ptsはsamplerate単位のタイムスタンプで、RTPのタイムスタンプにそのまま使われる。
+        frame = AudioFrame.from_ndarray(
+            samples.reshape(1, -1), format="s16", layout="mono"
+        )
+        frame.pts = pts
+        frame.time_base = self.time_base
+        frame.sample_rate = self.samplerate
+        packets: list[Packet] = self.codec.encode(frame)
+        # libopusのプリスキップ分ptsが負にずれるので、入力フレームのptsに揃える。
+        for packet in packets:
+            packet.pts = pts
+            packet.time_base = self.time_base
+        return packets
@@ -0,0 +1,62 @@
+import numpy as np
+from asyncio import Event
+from av.packet import Packet
+from .AudioSenderTrack import AudioSenderTrack
+from .AudioCaptureHub import AudioCaptureHub
+from .MonoOpusEncoder import MonoOpusEncoder
+
+
+class OpusSenderTrack(AudioSenderTrack):
+    # AudioSenderTrackと同じようにマイクから音声を取り込むが、
+    # recvでAudioFrameではなくエンコード済みのPacketを返す。
+    # aiortcのRTCRtpSenderはPacketを受け取るとエンコードせずにそのまま送るので、
+    # 48000Hz/2chへのリサンプルとステレオでのエンコードを省略できる。
+    def __init__(
+        self,
+        channels: int = 1,
+        samplerate: int = 48000,
+        dtype: str = "int16",
+        blocksize: int = 960,
+        device: str = "default",
+        latency: float | str | None = None,
+        shutdown_event: Event = Event(),
+        capture_hub: AudioCaptureHub | None = None,
+        bitrate: int = 24000,
+        complexity: int = 3,
+        fec: bool = True,
+        dtx: bool = False,
+        packet_loss: int = 10,
+        frame_duration: int = 20,
+    ):
+        super().__init__(
+            channels=channels,
+            samplerate=samplerate,
+            dtype=dtype,
+            blocksize=blocksize,
+            device=device,
+            latency=latency,
+            shutdown_event=shutdown_event,
+            capture_hub=capture_hub,
+        )
+        self.encoder: MonoOpusEncoder = MonoOpusEncoder(
+            samplerate=samplerate,
+            bitrate=bitrate,
+            complexity=complexity,
+            fec=fec,
+            dtx=dtx,
+            packet_loss=packet_loss,
+            frame_duration=frame_duration,
+        )
+        self.pending_packets: list[Packet] = []
+
+    # 40ms/60msのパケットにする場合は、1パケット分のブロックが揃うまで読み込む。
+    async def recv(self):
+        while not self.pending_packets:
+            blocks: list[np.ndarray] = [
+                await self._read_block()
+                for _ in range(self.encoder.frame_samples // self.blocksize)
+            ]
+            samples: np.ndarray = np.concatenate(blocks)
+            self.timestamp += len(samples)
+            self.pending_packets = self.encoder.encode(samples, self.timestamp)
+        return self.pending_packets.pop(0)
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import logging
+import requests
+import threading
+
+
+class ServerConfigCache:
+    # Sincromisorのconfig.jsonをcache_pathに保存しておき、起動時に待たずに使えるようにする。
+    # ttlを過ぎたものはキャッシュを返しつつ、裏でETag/Last-Modifiedを付けて再検証する。
+    # max_ageを過ぎたもの(またはキャッシュが無い場合)だけは、取得し終わるまで待つ。
+    def __init__(
+        self,
+        cache_path: str = "server_config_cache.json",
+        ttl: float = 60.0,
+        max_age: float = 86400.0,
+        timeout: float = 10.0,
+    ):
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.cache_path: str = cache_path
+        self.ttl: float = ttl
+        self.max_age: float = max_age
+        self.timeout: float = timeout
+        self.lock: threading.Lock = threading.Lock()
+        self.refreshing: set[str] = set()
+
+    def load_cache(self) -> dict:
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            self.logger.warning(["ServerConfigCacheError", e])
+            return {}
+
+    def __store(self, config_url: str, entry: dict) -> None:
+        with self.lock:
+            cache: dict = self.load_cache()
+            cache[config_url] = entry
+            # 書きかけのファイルを読まれないよう、一時ファイルに書いてから置き換える。
+            tmp_path: str = self.cache_path + ".tmp"
+            with open(tmp_path, "w") as file:
+                json.dump(cache, file, indent=2)
+            os.replace(tmp_path, self.cache_path)
+
+    def fetch(self, config_url: str, timeout: float | None = None) -> dict:
+        entry: dict | None = self.load_cache().get(config_url)
+        headers: dict = {}
+        if entry is not None:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        response = requests.get(
+            config_url, headers=headers, timeout=timeout or self.timeout
+        )
+        if response.status_code == 304 and entry is not None:
+            entry["fetched_at"] = time.time()
+        else:
+            response.raise_for_status()
+            entry = {
+                "body": response.json(),
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "fetched_at": time.time(),
+            }
+        self.__store(config_url, entry)
+        return entry["body"]
+
+    def get(self, config_url: str) -> dict:
+        entry: dict | None = self.load_cache().get(config_url)
+        if entry is None:
+            return self.fetch(config_url)
+        age: float = time.time() - entry["fetched_at"]
+        if age >= self.max_age:
+            return self.fetch(config_url)
+        if age >= self.ttl:
+            self.refresh_in_background(config_url)
+        return entry["body"]
+
+    def revalidate(self, config_url: str) -> dict:
+        # 再接続する時など、古いキャッシュのまま繋ぎにいくと失敗しやすい場面では、
+        # 待ってでも再検証する。サーバーに届かなければキャッシュ済みのものを使う。
+        try:
+            return self.fetch(config_url)
+        except (requests.RequestException, ValueError) as e:
+            entry: dict | None = self.load_cache().get(config_url)
+            if entry is None:
+                raise
+            self.logger.warning(["ServerConfigRevalidateError", config_url, e])
+            return entry["body"]
+
+    def refresh_in_background(self, config_url: str) -> None:
+        with self.lock:
+            if config_url in self.refreshing:
+                return
+            self.refreshing.add(config_url)
+        threading.Thread(target=self.__refresh, args=(config_url,), daemon=True).start()
+
+    def __refresh(self, config_url: str) -> None:
+        try:
+            self.fetch(config_url)
+            self.logger.info(f"server config revalidated: {config_url}")
+        except Exception as e:
+            # 取得できなくても、次に再検証するまでは古いキャッシュを使い続ける。
+            self.logger.warning(["ServerConfigRefreshError", config_url, e])
+        finally:
+            with self.lock:
+                self.refreshing.discard(config_url)
@@ -1,10 +1,27 @@
 import yaml
-import requests
+import logging
 import sounddevice as sd
 
 from enum import Enum
+from functools import cache
+from typing import ClassVar, Literal
 from urllib.parse import urljoin
 from pydantic import BaseModel, HttpUrl, Field, field_validator, model_validator, ConfigDict
+from .DeviceLatencyProbe import DeviceLatencyProbe
+from .ServerConfigCache import ServerConfigCache
+
+
+# PortAudioへの問い合わせは遅いことがあるので、プロセス内では1回だけにする。
+@cache
+def default_device_name(kind: int) -> str | None:
+    default_device: int = sd.default.device[kind]
+    if default_device < 0:
+        return None
+    return (
+        sd.query_devices()[default_device]["name"]
+        + ", "
+        + sd.query_hostapis()[sd.default.hostapi]["name"]
+    )
 
 
 class AudioDeviceConfig(BaseModel):
@@ -13,11 +30,29 @@ class AudioDeviceConfig(BaseModel):
     dtype: str
     blocksize: int
     device: str | None = Field(default=None)
+    # PortAudioに渡すレイテンシ(秒、"low"、"high")。
+    # "auto"とすると、SoundDeviceList.py --probeで測定した推奨値を使う。
+    latency: float | Literal["low", "high", "auto"] | None = Field(default=None)
+    kind: ClassVar[str] = ""
 
     @classmethod
     def default_device(cls) -> str | None:
         return None
 
+    @model_validator(mode="after")
+    def resolve_latency(self):
+        if self.latency == "auto":
+            self.latency = DeviceLatencyProbe().recommended_latency(
+                self.device, self.kind
+            )
+            if self.latency is None:
+                logging.getLogger(__name__).warning(
+                    f"No recommended {self.kind} latency for '{self.device}'."
+                    " Run `SoundDeviceList.py --probe` to measure it."
+                    " Falling back to the PortAudio default."
+                )
+        return self
+
     @field_validator("device", mode="before")
     def set_default_device(cls, value):
         if value is None:
@@ -50,16 +85,11 @@ class AudioDeviceConfig(BaseModel):
 
 
 class AudioInputDeviceConfig(AudioDeviceConfig):
+    kind: ClassVar[str] = "input"
+
     @classmethod
     def default_device(cls) -> str | None:
-        default_device: int = sd.default.device[0]
-        if default_device < 0:
-            return None
-        return (
-            sd.query_devices()[default_device]["name"]
-            + ", "
-            + sd.query_hostapis()[sd.default.hostapi]["name"]
-        )
+        return default_device_name(0)
 
     @field_validator("channels", mode="before")
     def default_dtype(cls, value):
@@ -69,16 +99,11 @@ class AudioInputDeviceConfig(AudioDeviceConfig):
 
 
 class AudioOutputDeviceConfig(AudioDeviceConfig):
+    kind: ClassVar[str] = "output"
+
     @classmethod
     def default_device(cls) -> str | None:
-        default_device: int = sd.default.device[1]
-        if default_device < 0:
-            return None
-        return (
-            sd.query_devices()[default_device]["name"]
-            + ", "
-            + sd.query_hostapis()[sd.default.hostapi]["name"]
-        )
+        return default_device_name(1)
 
     @field_validator("channels", mode="before")
     def default_dtype(cls, value):
@@ -86,6 +111,53 @@ class AudioOutputDeviceConfig(AudioDeviceConfig):
             raise ValueError("output channels must be 2.")
         return value
 
+class OpusEncoderConfig(BaseModel):
+    # native_monoをtrueにすると、aiortcでのステレオへのリサンプルを省き、
+    # モノラルのOpusとして直接エンコードして送信する(OpusSenderTrack)。
+    native_mono: bool = False
+    bitrate: int = 24000
+    complexity: int = 3
+    fec: bool = True
+    dtx: bool = False
+    packet_loss: int = 10
+    frame_duration: int = 20
+    # adaptiveをtrueにすると、通信状況に応じてbitrate/fec/packet_loss/frame_durationを
+    # 自動で切り替える(AdaptiveBitrateController)。判断結果はadaptive_logにJSON Linesで残せる。
+    adaptive: bool = False
+    adaptive_interval: float = 2.0
+    adaptive_log: str | None = None
+
+    @model_validator(mode="after")
+    def validate_adaptive(self):
+        if self.adaptive and not self.native_mono:
+            raise ValueError("adaptive requires native_mono.")
+        return self
+
+    @field_validator("bitrate", mode="after")
+    def check_bitrate(cls, value):
+        if not 6000 <= value <= 510000:
+            raise ValueError("bitrate must be between 6000 and 510000.")
+        return value
+
+    @field_validator("complexity", mode="after")
+    def check_complexity(cls, value):
+        if not 0 <= value <= 10:
+            raise ValueError("complexity must be between 0 and 10.")
+        return value
+
+    @field_validator("packet_loss", mode="after")
+    def check_packet_loss(cls, value):
+        if not 0 <= value <= 100:
+            raise ValueError("packet_loss must be between 0 and 100.")
+        return value
+
+    @field_validator("frame_duration", mode="after")
+    def check_frame_duration(cls, value):
+        if value not in (20, 40, 60):
+            raise ValueError("frame_duration must be 20, 40 or 60.")
+        return value
+
+
 class SincromisorTalkMode(str, Enum):
     chat = 'chat'
     sincro = 'sincro'
@@ -108,7 +180,7 @@ class RTCIceServerConfig(BaseModel):
         }
 
 
-class SincromisorClientConfig(BaseModel):
+class SignalingEndpointConfig(BaseModel):
     # Sincromisor本体の config.json (例: /api/v1/RTCSignalingServer/config.json) を指定すると、
     # offer/candidate/ICE設定を自動同期できる。
     config_url: HttpUrl | None = None
@@ -118,17 +190,15 @@ class SincromisorClientConfig(BaseModel):
     ice_server: str | None = None
     # 現行Sincromisor config.json互換: WebRTC標準形式の複数ICEサーバー定義
     ice_servers: list[RTCIceServerConfig] | None = None
-    talk_mode: SincromisorTalkMode
-    sender_device: AudioInputDeviceConfig
-    receiver_device: AudioOutputDeviceConfig
 
-    @model_validator(mode="after")
-    def validate_signaling_settings(self):
-        if self.offer_url is None:
-            raise ValueError("offer_url is required (or specify config_url).")
-        if not self.ice_server and not self.ice_servers:
-            raise ValueError("ice_server or ice_servers is required (or specify config_url).")
-        return self
+    @property
+    def key(self) -> str:
+        # 接続先を区別するためのキー。プローブ結果のキャッシュに使う。
+        return str(self.config_url or self.offer_url)
+
+    @property
+    def is_resolved(self) -> bool:
+        return self.offer_url is not None and bool(self.ice_server or self.ice_servers)
 
     @property
     def resolved_candidate_url(self) -> str:
@@ -150,15 +220,8 @@ class SincromisorClientConfig(BaseModel):
         raise ValueError("ice_server(s) is not resolved.")
 
     @classmethod
-    def _merge_signaling_config(cls, data: dict) -> dict:
-        config_url = data.get("config_url")
-        if not config_url:
-            return data
-
-        response = requests.get(str(config_url), timeout=10)
-        response.raise_for_status()
-        server_config = response.json()
-        base_url = str(config_url)
+    def _apply_server_config(cls, data: dict, server_config: dict) -> dict:
+        base_url = str(data["config_url"])
 
         # config.yml 明示指定を優先し、未指定値のみ config.json から補完する。
         if "offer_url" not in data and "offerURL" in server_config:
@@ -174,9 +237,115 @@ class SincromisorClientConfig(BaseModel):
 
         return data
 
+    def resolve(
+        self,
+        server_config_cache: ServerConfigCache,
+        server_config: dict | None = None,
+        revalidate: bool = False,
+    ) -> "SignalingEndpointConfig":
+        # config.jsonの内容で未指定の値を補完したものを返す。
+        # revalidateがTrueなら、キャッシュを使う前にサーバーに再検証する(再接続時)。
+        # offer_urlやICEサーバーが揃わなければ、このサーバーには接続できないのでValueErrorにする。
+        resolved: SignalingEndpointConfig = self
+        if self.config_url is not None:
+            if server_config is None and revalidate:
+                server_config = server_config_cache.revalidate(str(self.config_url))
+            elif server_config is None:
+                server_config = server_config_cache.get(str(self.config_url))
+            data: dict = self.model_dump(mode="json", exclude_none=True, by_alias=True)
+            resolved = SignalingEndpointConfig(**self._apply_server_config(data, server_config))
+        if not resolved.is_resolved:
+            raise ValueError(
+                f"{self.key}: offer_url and ice_server(s) are not resolved"
+                " (check offerURL/iceServers in config.json)."
+            )
+        return resolved
+
+
+class ServerConfigCacheConfig(BaseModel):
+    # config.jsonのキャッシュ設定。ttl秒を過ぎたらバックグラウンドで再検証し、
+    # max_age秒を過ぎたら起動時に取得し直す。
+    cache_path: str = "server_config_cache.json"
+    ttl: float = 60.0
+    max_age: float = 86400.0
+    timeout: float = 10.0
+
+
+class EndpointProbeConfig(BaseModel):
+    # endpointsを複数指定した時に、起動時に各サーバーへの応答時間を測る設定。
+    # 結果はcache_pathにttl秒間キャッシュされ、その間は測り直さずに使う。
+    cache_path: str = "endpoint_probe.json"
+    ttl: float = 300.0
+    timeout: float = 3.0
+    # ICEサーバー(STUN/TURN)への候補収集時間も測る
+    ice: bool = False
+
+
+class SincromisorClientConfig(SignalingEndpointConfig):
+    # 複数のSincromisorサーバーを使う場合はendpointsに列挙する。
+    # 起動時に応答の速いものから順に接続し、失敗したら次のサーバーへ切り替える。
+    endpoints: list[SignalingEndpointConfig] | None = None
+    endpoint_probe: EndpointProbeConfig = Field(default_factory=EndpointProbeConfig)
+    server_config_cache: ServerConfigCacheConfig = Field(
+        default_factory=ServerConfigCacheConfig
+    )
+    talk_mode: SincromisorTalkMode
+    sender_device: AudioInputDeviceConfig
+    receiver_device: AudioOutputDeviceConfig
+    sender_encoder: OpusEncoderConfig = Field(default_factory=OpusEncoderConfig)
+
+    @model_validator(mode="after")
+    def validate_signaling_settings(self):
+        # config_urlのconfig.jsonは、セッションを張る時にServerConfigCacheから補完する。
+        if self.endpoints:
+            for endpoint in self.endpoints:
+                if endpoint.config_url is not None:
+                    continue
+                if endpoint.offer_url is None:
+                    raise ValueError("each endpoint requires config_url or offer_url.")
+                if endpoint.ice_server or endpoint.ice_servers:
+                    continue
+                # config_urlの無いendpointでICEサーバーが未指定なら、トップレベルの指定を引き継ぐ。
+                if not self.ice_server and not self.ice_servers:
+                    raise ValueError(
+                        f"endpoint {endpoint.key} requires ice_server or ice_servers"
+                        " (or specify config_url, or ice_server(s) at the top level)."
+                    )
+                endpoint.ice_server = self.ice_server
+                endpoint.ice_servers = self.ice_servers
+            return self
+        if self.config_url is not None:
+            return self
+        if self.offer_url is None:
+            raise ValueError("offer_url is required (or specify config_url).")
+        if not self.ice_server and not self.ice_servers:
+            raise ValueError("ice_server or ice_servers is required (or specify config_url).")
+        return self
+
+    @property
+    def signaling_endpoints(self) -> list[SignalingEndpointConfig]:
+        if self.endpoints:
+            return self.endpoints
+        return [
+            SignalingEndpointConfig(
+                config_url=self.config_url,
+                offer_url=self.offer_url,
+                candidate_url=self.candidate_url,
+                ice_server=self.ice_server,
+                ice_servers=self.ice_servers,
+            )
+        ]
+
     @classmethod
     def from_yaml(cls, yaml_path) -> "SincromisorClientConfig":
         with open(yaml_path, "r") as file:
             data = yaml.safe_load(file)
-            data = cls._merge_signaling_config(data)
             return SincromisorClientConfig(**data)
+
+    def create_server_config_cache(self) -> ServerConfigCache:
+        return ServerConfigCache(
+            cache_path=self.server_config_cache.cache_path,
+            ttl=self.server_config_cache.ttl,
+            max_age=self.server_config_cache.max_age,
+            timeout=self.server_config_cache.timeout,
+        )
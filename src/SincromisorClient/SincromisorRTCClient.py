@@ -18,6 +18,8 @@ from aiortc.sdp import candidate_to_sdp
 from aiortc.mediastreams import MediaStreamError
 from av.audio.frame import AudioFrame
 from . import AudioPlayer
+from .AudioMixer import AudioMixerSource
+from .AdaptiveBitrateController import AdaptiveBitrateController
 
 
 class SincromisorRTCClient:
@@ -32,6 +34,7 @@ class SincromisorRTCClient:
         talk_mode: str,
         ice_servers: list[dict[str, Any]] | None = None,
         shutdown_event: Event = Event(),
+        bitrate_controller: AdaptiveBitrateController | None = None,
     ):
         self.logger: logging.Logger = logging.getLogger(__name__)
         self.offer_url: str = offer_url
@@ -41,7 +44,11 @@ class SincromisorRTCClient:
         self.talk_mode: str = talk_mode
         self.shutdown_event: Event = shutdown_event
         self.session_id: str | None = None
+        # 一度でもICEの接続が確立したか。切断後に再接続するかどうかの判断に使う。
+        self.connected: bool = False
         self.pending_ice_candidates: list[dict | None] = []
+        self.bitrate_controller: AdaptiveBitrateController | None = bitrate_controller
+        self.bitrate_controller_task: asyncio.Task | None = None
         self.rpc: RTCPeerConnection = RTCPeerConnection(
             configuration=RTCConfiguration(
                 iceServers=self.__build_ice_servers(
@@ -81,34 +88,49 @@ class SincromisorRTCClient:
 
     async def run(self) -> None:
         await self.__offer()
+        if self.bitrate_controller is not None:
+            self.bitrate_controller_task = asyncio.create_task(
+                self.bitrate_controller.run(self.rpc, self.shutdown_event)
+            )
         while True:
             if self.current_ice_state != self.rpc.iceConnectionState:
                 self.logger.info(f'ICE Status: {self.rpc.iceConnectionState}')
                 self.current_ice_state = self.rpc.iceConnectionState
 
             match self.rpc.iceConnectionState:
-                case "checking" | "connected" | "completed":
+                case "checking":
                     pass
+                case "connected" | "completed":
+                    self.connected = True
                 case "closed":
                     self.shutdown_event.set()
                     break
+                case "failed":
+                    # 呼び出し側で別のサーバーへ切り替えられるよう例外にする。
+                    raise ConnectionError("ICE connection failed.")
                 case _:
                     self.logger.info(["iceConnectionState", self.rpc.iceConnectionState])
+            self.logger.debug(["AudioPlayerMetrics", self.player.metrics()])
             await asyncio.sleep(1)
 
     def __setup_receiver_track(self) -> None:
         @self.rpc.on("track")
         async def on_track(track: MediaStreamTrack):
             self.logger.info(["on_track", track.kind, track])
+            # トラックごとにミキサーのソースを分け、複数のトラックやセッションの音を混ぜて再生する。
+            source: AudioMixerSource = self.player.add_source(
+                f"{self.session_id}/{track.id}"
+            )
             try:
                 while not self.shutdown_event.is_set():
                     frame: AudioFrame = await track.recv()
-                    self.player.add_frame(frame)
+                    self.player.add_frame(frame, source)
             except MediaStreamError as e:
                 self.logger.warning(["MediaStreamError", e])
             except Exception as e:
                 self.logger.error(["UnknownError", e])
             self.logger.info("close RTC track")
+            self.player.remove_source(source)
             track.stop()
 
     def __setup_text_ch(self) -> RTCDataChannel:
@@ -168,7 +190,7 @@ class SincromisorRTCClient:
         if response.status_code != 200:
             msg = f"Offer response was invalid - {response.status_code}"
             self.logger.error(msg)
-            raise msg
+            raise ConnectionError(msg)
         return response.json()
 
     def __setup_icecandidate(self) -> None:
@@ -240,6 +262,8 @@ class SincromisorRTCClient:
     async def close(self):
         if not self.shutdown_event.is_set():
             self.shutdown_event.set()
+        if self.bitrate_controller_task is not None:
+            self.bitrate_controller_task.cancel()
         self.logger.info("telop_ch is closing...")
         self.telop_ch.close()
         self.logger.info("text_ch is closing...")
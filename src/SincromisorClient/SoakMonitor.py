@@ -0,0 +1,185 @@
+import gc
+import os
+import json
+import time
+import asyncio
+import logging
+import tracemalloc
+import numpy as np
+from asyncio import Event
+from typing import Callable
+
+
+class SoakMonitor:
+    # 長時間動かした時のリソースの推移を記録する。
+    # interval秒ごとにRSS、tracemallocで追跡中のメモリ、イベントループの遅れ、GCの停止時間、
+    # タスク数と、add_gaugeで登録した値(キューの深さなど)を記録し、
+    # 最後に各値の増加傾向(1時間あたりの傾き)を求めて閾値と比べる。
+    # 音声をspeed倍の速さで流している場合、傾きはセッション時間(実時間のspeed倍)の1時間あたりに直す。
+    def __init__(
+        self,
+        interval: float = 1.0,
+        speed: float = 1.0,
+        warmup: float = 0.2,
+        lag_probe_interval: float = 0.01,
+        top_allocators: int = 10,
+    ):
+        self.logger: logging.Logger = logging.getLogger(__name__)
+        self.interval: float = interval
+        self.speed: float = speed
+        # 起動直後はキャッシュなどで増えるのが普通なので、傾きの計算から除く割合。
+        self.warmup: float = warmup
+        self.lag_probe_interval: float = lag_probe_interval
+        self.top_allocators: int = top_allocators
+        self.gauges: dict[str, Callable[[], float]] = {}
+        self.samples: list[dict] = []
+        self.max_loop_lag: float = 0.0
+        self.gc_pause_started_at: float | None = None
+        self.gc_pauses: list[float] = []
+        # 傾きとは別に、測っている側で見つけた失敗(セッションが切れたなど)と、
+        # 負荷が高すぎて結果を信用できない理由。
+        self.failures: list[str] = []
+        self.invalid_reasons: list[str] = []
+        self.first_snapshot: tracemalloc.Snapshot | None = None
+        self.last_snapshot: tracemalloc.Snapshot | None = None
+
+    def add_gauge(self, name: str, gauge: Callable[[], float]) -> None:
+        self.gauges[name] = gauge
+
+    def fail(self, reason: str) -> None:
+        self.logger.error(["SoakFailure", reason])
+        self.failures.append(reason)
+
+    def invalidate(self, reason: str) -> None:
+        self.logger.warning(["SoakInvalid", reason])
+        self.invalid_reasons.append(reason)
+
+    @staticmethod
+    def rss_bytes() -> int:
+        # Linuxでは現在のRSSを、それ以外ではピークのRSSを使う。
+        try:
+            with open("/proc/self/statm", "r") as file:
+                return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except OSError:
+            pass
+        try:
+            import resource
+        except ImportError:
+            # Windowsでは取得しない。
+            return 0
+        maxrss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOSはバイト、Linuxはキロバイト単位
+        return maxrss if os.uname().sysname == "Darwin" else maxrss * 1024
+
+    def __gc_callback(self, phase: str, info: dict) -> None:
+        if phase == "start":
+            self.gc_pause_started_at = time.perf_counter()
+        elif phase == "stop" and self.gc_pause_started_at is not None:
+            self.gc_pauses.append(time.perf_counter() - self.gc_pause_started_at)
+            self.gc_pause_started_at = None
+
+    async def __probe_loop_lag(self, shutdown_event: Event) -> None:
+        # 短いsleepがどれだけ遅れて戻ってくるかで、イベントループの詰まり具合を測る。
+        while not shutdown_event.is_set():
+            start: float = time.perf_counter()
+            await asyncio.sleep(self.lag_probe_interval)
+            lag: float = time.perf_counter() - start - self.lag_probe_interval
+            self.max_loop_lag = max(self.max_loop_lag, lag)
+
+    def sample(self, elapsed: float) -> dict:
+        gc_pauses, self.gc_pauses = self.gc_pauses, []
+        traced, _ = tracemalloc.get_traced_memory()
+        sample: dict = {
+            "elapsed": elapsed,
+            "session_elapsed": elapsed * self.speed,
+            "rss_mb": self.rss_bytes() / 1024 / 1024,
+            "traced_mb": traced / 1024 / 1024,
+            "loop_lag_ms": self.max_loop_lag * 1000,
+            "gc_collections": len(gc_pauses),
+            "gc_pause_max_ms": max(gc_pauses, default=0.0) * 1000,
+            "gc_pause_total_ms": sum(gc_pauses) * 1000,
+            "tasks": len(asyncio.all_tasks()),
+        }
+        self.max_loop_lag = 0.0
+        for name, gauge in self.gauges.items():
+            sample[name] = gauge()
+        self.samples.append(sample)
+        return sample
+
+    async def run(self, shutdown_event: Event) -> None:
+        tracemalloc.start()
+        gc.callbacks.append(self.__gc_callback)
+        lag_task = asyncio.create_task(self.__probe_loop_lag(shutdown_event))
+        started_at: float = time.perf_counter()
+        self.first_snapshot = tracemalloc.take_snapshot()
+        try:
+            while not shutdown_event.is_set():
+                await asyncio.sleep(self.interval)
+                sample: dict = self.sample(time.perf_counter() - started_at)
+                self.logger.info(["SoakSample", sample])
+            self.last_snapshot = tracemalloc.take_snapshot()
+        finally:
+            lag_task.cancel()
+            gc.callbacks.remove(self.__gc_callback)
+            tracemalloc.stop()
+
+    def trends(self, per_wall_clock: bool = False) -> dict[str, float]:
+        # ウォームアップ後のサンプルに直線を当てはめ、1時間あたりの増加量を求める。
+        # 既定ではセッション時間の1時間あたり、per_wall_clockがTrueなら実時間の1時間あたり。
+        samples: list[dict] = self.samples[int(len(self.samples) * self.warmup):]
+        if len(samples) < 2:
+            return {}
+        time_key: str = "elapsed" if per_wall_clock else "session_elapsed"
+        elapsed: np.ndarray = np.array([sample[time_key] for sample in samples])
+        trends: dict[str, float] = {}
+        for name in samples[0]:
+            if name in ("elapsed", "session_elapsed"):
+                continue
+            values: np.ndarray = np.array([sample[name] for sample in samples], dtype=float)
+            slope: float = float(np.polyfit(elapsed, values, 1)[0])
+            trends[name] = slope * 3600
+        return trends
+
+    def check(self, thresholds: dict[str, float]) -> list[str]:
+        # thresholdsは {値の名前: セッション時間1時間あたりの許容増加量}。
+        trends: dict[str, float] = self.trends()
+        failures: list[str] = []
+        for name, threshold in thresholds.items():
+            if name in trends and trends[name] > threshold:
+                failures.append(
+                    f"{name} grows {trends[name]:.3f}/h (threshold {threshold}/h)"
+                )
+        return failures
+
+    def allocators(self) -> list[dict]:
+        # 開始時からの増加量が大きい順に、メモリを確保しているコードの場所を返す。
+        if self.first_snapshot is None or self.last_snapshot is None:
+            return []
+        stats = self.last_snapshot.compare_to(self.first_snapshot, "lineno")
+        return [
+            {
+                "location": str(stat.traceback),
+                "size_diff_kb": stat.size_diff / 1024,
+                "size_kb": stat.size / 1024,
+                "count_diff": stat.count_diff,
+            }
+            for stat in stats[: self.top_allocators]
+        ]
+
+    def report(self, path: str, thresholds: dict[str, float]) -> dict:
+        report: dict = {
+            "samples": self.samples,
+            "speed": self.speed,
+            # セッション時間の1時間あたり(閾値と比べる値)と、実時間の1時間あたり
+            "trends_per_hour": self.trends(),
+            "trends_per_wall_clock_hour": self.trends(per_wall_clock=True),
+            "thresholds_per_hour": thresholds,
+            "top_allocators": self.allocators(),
+            # セッションが切れるなどして打ち切った場合、その後の値の変化は原因ではなく結果なので、
+            # 傾きでの判定は行わずに打ち切った理由だけを返す。
+            "failures": self.failures or self.check(thresholds),
+            "invalid": self.invalid_reasons,
+        }
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
+        return report
@@ -1,5 +1,13 @@
 from .AudioSenderTrack import AudioSenderTrack
 from .AudioPlayer import AudioPlayer
+from .AudioMixer import AudioMixer, AudioMixerSource
 from .AudioRecorderProcess import AudioRecorderProcess
+from .AudioCaptureHub import AudioCaptureHub
+from .MonoOpusEncoder import MonoOpusEncoder
+from .OpusSenderTrack import OpusSenderTrack
+from .AdaptiveBitrateController import AdaptiveBitrateController
 from .SincromisorRTCClient import SincromisorRTCClient
-from .SincromisorConfig import SincromisorClientConfig, AudioDeviceConfig
+from .SincromisorConfig import SincromisorClientConfig, AudioDeviceConfig, OpusEncoderConfig, SignalingEndpointConfig
+from .EndpointSelector import EndpointSelector
+from .ServerConfigCache import ServerConfigCache
+from .SoakMonitor import SoakMonitor